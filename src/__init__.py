@@ -1,7 +1,11 @@
-import src.graph
-import src.navigation
-import src.visualization
-import src.MAPF
-import src.flows
-import src.models.DQL
+import importlib
 
+#the subpackages are imported on first access (src.graph, src.flows...), so that importing a small module
+#such as src.graph.transitions does not load networkx, matplotlib or the solvers
+SUBPACKAGES = ['graph', 'navigation', 'visualization', 'MAPF', 'flows', 'models']
+
+
+def __getattr__(name):
+	if name in SUBPACKAGES:
+		return importlib.import_module('.' + name, __name__)
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,7 +3,7 @@ import networkx as nx
 import random
 import time
 
-from utils import *
+from src.benchmark.utils import *
 
 
 
@@ -26,6 +26,11 @@ class EnvWrapperGraph(RailEnv):
 
 	The graph_low_level G = (V,E) with G representing two nodes per cell in the matrix to represent the and E being 
 	directed edges 
+
+	Both graphs are only built when one of them is first accessed, and rebuilt when the rail (or its grid 
+	array) has been replaced since, e.g. by reset with a new rail. The check is by identity, so reading the 
+	graphs costs nothing in a loop: after modifying the grid in place call recompute_graph. The check of the 
+	connections of the turn cells (find_wrong_connections) is only done if validate_graph is True.
 	'''
 
 	def __init__(self,
@@ -36,69 +41,104 @@ class EnvWrapperGraph(RailEnv):
                  number_of_agents=1,
                  obs_builder_object: ObservationBuilder = TreeObsForRailEnv(max_depth=2),
                  max_episode_steps=None,
-                 stochastic_data=None
+                 stochastic_data=None,
+                 validate_graph = False
                  ):
+		#the graphs are built lazily, for the rail and grid objects below (see __update_graphs)
+		self.__graphs_rail = None
+		self.__graphs_grid = None
+		self.__graph_high_level = None
+		self.__graph_low_level = None
+		self.validate_graph = validate_graph
+
 		super().__init__(width,height,rail_generator, 
 						schedule_generator,number_of_agents,
 						obs_builder_object)
 
-		self.graph_low_level = nx.DiGraph()
-		self.graph_high_level = nx.Graph()
-		self.create_graph_from_env(self.obs_builder)
+
+	@property
+	def graph_high_level(self):
+		self.__update_graphs()
+		return self.__graph_high_level
+
+	@property
+	def graph_low_level(self):
+		self.__update_graphs()
+		return self.__graph_low_level
+
+	def __update_graphs(self):
+		'''
+		build the graphs if they were never built or if the rail or its grid was replaced since
+		'''
+		if self.__graphs_rail is not self.rail or self.__graphs_grid is not self.rail.grid:
+			self.create_graph_from_env(self.obs_builder)
 
 
 	def recompute_graph(self):
 
-		#reinitialize the graphs
-		self.graph_high_level = nx.Graph()
-		self.graph_low_level = nx.DiGraph()
+		#rebuild the graphs even if the rail was not replaced (e.g. the grid was modified in place)
 		self.create_graph_from_env(self.obs_builder, verbose = True)
 
 	def create_graph_from_env(self,observation_builder, verbose = False):
 		'''
-		create the graph representations from the env object
+		create the graph representations from the env object, if verbose the low level graph is shown 
+		once it is built
 		'''
 
 		#initialize the graphs
-		graph_low_level = self.graph_low_level
-		graph_high_level = self.graph_high_level
+		graph_low_level = nx.DiGraph()
+		graph_high_level = nx.Graph()
 
 		#get the matrix representing the environment
 		matrix_rail = np.array(self.rail.grid.tolist())
+		turn_mask = get_turn_cells(matrix_rail)
+		turn_cells = [tuple(index) for index in np.argwhere(turn_mask)]
 
 		self.__add_nodes(graph_high_level,graph_low_level,matrix_rail)
 
-		self.__add_edges(graph_high_level,graph_low_level,matrix_rail, verbose = verbose)
+		self.__add_edges(graph_high_level,graph_low_level,matrix_rail)
 
-		for node,_ in np.ndenumerate(matrix_rail):
-			if tuple_to_str(node) in graph_high_level.nodes:
-				check, error = is_wrong_connections(node, graph_low_level, matrix_rail)
-				if check:
-					print(f'node {node} has a bad connection: {error}')
+		if self.validate_graph:
+			self.__check_connections(turn_mask, graph_low_level)
 
 		#correct the low_level_graph
-		self.__correct_graph(matrix_rail,graph_low_level)
+		self.__correct_graph(turn_cells,matrix_rail,graph_low_level)
+
+		if self.validate_graph:
+			self.__check_connections(turn_mask, graph_low_level)
 
+		self.__graph_high_level = graph_high_level
+		self.__graph_low_level = graph_low_level
+		self.__graphs_rail = self.rail
+		self.__graphs_grid = self.rail.grid
 
-		for node,_ in np.ndenumerate(matrix_rail):
-			if tuple_to_str(node) in graph_high_level.nodes:
-				check, error = is_wrong_connections(node, graph_low_level, matrix_rail)
-				if check:
-					print(f'node {node} has a bad connection: {error}')
+		if verbose:
+			self.show_graph(high_level=False)
 
 
-	def __add_edges(self,graph_high_level,graph_low_level,matrix_rail, verbose = False):
+	def __check_connections(self, turn_mask, graph_low_level):
+		'''
+		print the wrong connections of the turn cells (see find_wrong_connections)
+		'''
+		width = turn_mask.shape[1]
+		for error in find_wrong_connections(graph_low_level, turn_mask):
+			print(f'node {id_to_tuple(error[0], width)[0]} has a bad connection: {error}')
+
+
+	def __add_edges(self,graph_high_level,graph_low_level,matrix_rail):
 		'''
 		add the edges to the graph
 		'''
 
-		for index,value in np.ndenumerate(matrix_rail):
+		for index in np.argwhere(matrix_rail > 0):
+			index = tuple(index)
+			value = matrix_rail[index]
 			self.__create_edges_one_cell(index,value,graph_high_level,'high')
-			self.__create_edges_one_cell(index,value,graph_low_level,'low',matrix_rail, verbose = verbose)
+			self.__create_edges_one_cell(index,value,graph_low_level,'low',matrix_rail)
 
 
 
-	def __create_edges_one_cell(self,index,value,graph,level = 'high', matrix_rail = None, verbose = False):
+	def __create_edges_one_cell(self,index,value,graph,level = 'high', matrix_rail = None):
 		'''
 		Given a cell transtions possibilities, create edges and connect the cell to its neighbour 
 		with a convention to keep the "two way railway design" consistent in the case of th low
@@ -118,34 +158,31 @@ class EnvWrapperGraph(RailEnv):
 
 
 		#conversion
-		name_node = tuple_to_str(index)
+		width = self.rail.grid.shape[1]
+		name_node = tuple_to_id(index,width)
 
 		if level == 'low':
 			# #get the possible transitions
 			# results = identify_crossing(value)
 			# for key,goals in results.items():
 			# 	#get the departing node based on from where the train is coming
-			# 	e1 = name_node + CONVENTION[key]
+			# 	e1 = set_port(name_node,SIDE_INDEX[CONVENTION[key]])
 			# 	for goal in goals:
 			# 		#get the goal node based on where the train is going
-			# 		e2 = tuple_to_str(get_node_direction(index,goal)) +CONVENTION[goal]
+			# 		e2 = tuple_to_id(get_node_direction(index,goal),width,CONVENTION[goal])
 			# 		if e1 in graph.nodes and e2 in graph.nodes:	
 			# 			print(f'added {e1,e2} since {index}, from {key} to {goal}')
 			# 			graph.add_edge(e1,e2)
 			# 		else:
 			# 			print(f'warning on edge {e1}-->{e2}')
 			list_edges = self.transitions_to_edges(index,matrix_rail)
-			previous = len(graph.edges)
 			graph.add_edges_from(list_edges)
 
-			if previous < len(graph.edges) and verbose:
-				self.show_graph(high_level=False)
-
 		elif level == 'high':
 			results = identify_crossing(value)
 			for start,end in results.items():
 				for goal in end:
-					e2 = tuple_to_str(get_node_direction(index,goal))
+					e2 = tuple_to_id(get_node_direction(index,goal),width)
 					if name_node in graph.nodes and e2 in graph.nodes:
 						graph.add_edge(name_node,e2)
 					else:
@@ -154,9 +191,10 @@ class EnvWrapperGraph(RailEnv):
 			raise ValueError(f"only implementation for low and high level graphs, not {level}")
 
 	
-	def __correct_graph(self,matrix, graph_low_level):
+	def __correct_graph(self,turn_cells,matrix, graph_low_level):
 		#correct_double_edges_if_needed(graph_low_level,matrix)
-		for index,value in np.ndenumerate(matrix):
+		#swap_if_needed only changes turn cells
+		for index in turn_cells:
 			swap_if_needed(index,graph_low_level,matrix)
 			
 
@@ -167,19 +205,18 @@ class EnvWrapperGraph(RailEnv):
 		'''
 		add nodes based on the matrix rail
 
-		the names of the nodes are obtained in the following way: 
-		(x,y) --> '000x000y' in the graph_high_level
-		(x,y) --> {'000x000ya' ,''000x000yb'} in the graph_low_level
+		the names of the nodes are the int ids of src.graph.node_ids (see tuple_to_id): 
+		(x,y) --> id of (x,y) side 'a' in the graph_high_level
+		(x,y) --> {id of (x,y) side 'a', id of (x,y) side 'b'} in the graph_low_level
 		'''
 
 		#add the rails to the graph as nodes (rails are positive in the matrix)
-		list_nodes = [tuple_to_str(index) for index, x in np.ndenumerate(matrix_rail) if x >0 ]
-		graph_high_level.add_nodes_from(list_nodes)
-
+		rows, cols = np.nonzero(matrix_rail > 0)
+		width = matrix_rail.shape[1]
+		graph_high_level.add_nodes_from(encode(rows,cols,SIDE_INDEX['a'],width).tolist())
 
-		for elt in list_nodes:
-			graph_low_level.add_node(elt + "a", group = 'a')
-			graph_low_level.add_node(elt + "b", group = 'b')
+		for side in SIDES:
+			graph_low_level.add_nodes_from(encode(rows,cols,SIDE_INDEX[side],width).tolist(), group = side)
 
 	def show_graph(self,high_level = True,options = None, figsize = (10,10)):
 		'''
@@ -221,12 +258,9 @@ class EnvWrapperGraph(RailEnv):
 
 		plt.show()
 
-	def position(self,node_str, high_level= True):
+	def position(self,node, high_level= True):
 		ecart = 0.1
-		if high_level:
-			index = str_to_tuple(node_str)
-		else:
-			index = str_to_tuple(node_str[:-1])
+		index, side = id_to_tuple(node,self.rail.grid.shape[1])
 
 		if high_level:
 			return (index[1],-index[0])
@@ -234,7 +268,7 @@ class EnvWrapperGraph(RailEnv):
 		else:
 			y_coord = index[1]
 			x_coord = index[0]
-			if node_str[-1] == 'a':
+			if side == 'a':
 				y_coord = index[1] + ecart
 				x_coord = index[0] + ecart
 			else:
@@ -264,7 +298,8 @@ class EnvWrapperGraph(RailEnv):
 		list_of_edges_to_add = []
 
 		#get the name of the node
-		name_node = tuple_to_str(cell_index)
+		width = matrix_transition.shape[1]
+		name_node = tuple_to_id(cell_index,width)
 
 		#get the dictionnary of transition
 		results = identify_crossing(matrix_transition[cell_index])
@@ -272,13 +307,13 @@ class EnvWrapperGraph(RailEnv):
 		for key,goals in results.items():
 
 			#get the departing node based on from where the train is coming
-			e1 = name_node + CONVENTION[key]
+			e1 = set_port(name_node,SIDE_INDEX[CONVENTION[key]])
 
 			for goal in goals:
 
 				#get the goal node based on where the train is going by default
 				cell_receiving = get_node_direction(cell_index,goal)
-				e2 = tuple_to_str(cell_receiving) +CONVENTION[goal]
+				e2 = tuple_to_id(cell_receiving,width,CONVENTION[goal])
 
 				#check how the receiving node will behave 
 				transitions_tmp = identify_crossing(matrix_transition[cell_receiving])
@@ -295,7 +330,7 @@ class EnvWrapperGraph(RailEnv):
 
 							
 									list_of_edges_to_add.remove((e1,e2))
-									e2 = e2[:-1] + CONVENTION[elt]
+									e2 = set_port(e2,SIDE_INDEX[CONVENTION[elt]])
 									list_of_edges_to_add.append((e1,e2))
 									break
 						
@@ -0,0 +1,116 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from urllib.parse import unquote
+
+#columns used to partition the dataset, each record must have them
+PARTITION_COLS = ['method','grid_size']
+
+
+def grid_size(width, height):
+	'''
+	value of the grid_size column, e.g. '30x20'
+	'''
+	return str(width)+"x"+str(height)
+
+
+class ResultsWriter:
+	'''
+	write the results of experiment sweeps (one record, a dict, per run) to a parquet dataset in root
+	partitioned by method and grid size (root/method=.../grid_size=.../*.parquet)
+
+	the records are kept in memory and written as a new file of each partition every flush_every
+	records, so a crash only loses the records of the last flush_every runs. The writer should be closed
+	(or used in a with statement) to write the remaining records
+
+	Examples
+	--------
+	\\>> with ResultsWriter("../data/processed/comparison", flush_every = 10) as writer:
+	\\>> 	solver.solve(env, results_writer = writer)
+	\\>> df = read_results("../data/processed/comparison", method = "Column Generation")
+	'''
+
+	def __init__(self, root, flush_every = 100):
+		self.root = root
+		self.flush_every = flush_every
+		self.records = []
+		self.n_written = 0
+
+	def write(self, record):
+		'''
+		add one record, flush if flush_every records are waiting
+
+		Parameters
+		----------
+		record : dict
+			column name -> value, must contain the keys of PARTITION_COLS
+		'''
+		for col in PARTITION_COLS:
+			if col not in record:
+				raise ValueError(f"the record {record} has no {col}")
+		self.records.append(record)
+		if len(self.records) >= self.flush_every:
+			self.flush()
+
+	def flush(self):
+		'''
+		write the waiting records to the dataset
+		'''
+		if len(self.records) == 0:
+			return
+		table = pa.Table.from_pandas(pd.DataFrame(self.records), preserve_index = False)
+		pq.write_to_dataset(table, self.root, partition_cols = PARTITION_COLS)
+		self.n_written += len(self.records)
+		self.records = []
+
+	def close(self):
+		self.flush()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+
+def iter_results(root, columns = None, **filters):
+	'''
+	lazy reader of a dataset written by ResultsWriter, yield one DataFrame per file, the partitions are
+	selected from the directory names before any file is read
+
+	Parameters
+	----------
+	root : str
+	columns : list, optional
+		columns to read (the partition columns are always added), by default all of them
+	filters : partition column -> value or list of values, e.g. method = ["Column Generation", "Q-learning"]
+	'''
+	filters = {key : [str(x) for x in (value if isinstance(value, (list, tuple, set)) else [value])]
+			   for key, value in filters.items()}
+	for directory, _, files in sorted(os.walk(root)):
+		partitions = {}
+		for part in os.path.relpath(directory, root).split(os.sep):
+			if "=" in part:
+				key, value = part.split("=", 1)
+				partitions[key] = unquote(value)
+		if any(partitions.get(key) not in values for key, values in filters.items()):
+			continue
+		for name in sorted(files):
+			if not name.endswith(".parquet"):
+				continue
+			file_columns = None if columns is None else [col for col in columns if col not in partitions]
+			df = pq.read_table(os.path.join(directory, name), columns = file_columns).to_pandas()
+			for key, value in partitions.items():
+				df[key] = value
+			yield df
+
+
+def read_results(root, columns = None, **filters):
+	'''
+	read a dataset written by ResultsWriter as a single DataFrame (see iter_results for the parameters)
+	'''
+	frames = list(iter_results(root, columns, **filters))
+	if len(frames) == 0:
+		return pd.DataFrame(columns = PARTITION_COLS)
+	return pd.concat(frames, ignore_index = True, sort = False)
@@ -1,4 +1,6 @@
 import numpy as np
+from src.graph.transitions import transition_dict, get_turns
+from src.graph.node_ids import encode, decode, cell_of, set_port, SIDES, SIDE_INDEX
 
 
 LISTE_TRANSITIONS =   [int('0000000000000000', 2),  # empty cell - Case 0
@@ -60,18 +62,20 @@ def get_node_direction(index,direction):
 	else:
 		raise ValueError(f"direction not recognized: {direction}")
 
-def tuple_to_str(x, filled = 4):
+def tuple_to_id(x, width, side = 'a'):
 	'''
-	(x,y) --> '000x000y'
+	(x,y) --> id of the node side ('a' or 'b') of the cell (see src.graph.node_ids), the node of a cell in 
+	the high level graph is the one of side 'a'
 	'''
-	return str(x[0]).zfill(filled)+str(x[1]).zfill(filled)
+	return encode(x[0],x[1],SIDE_INDEX[side],width)
 
 
-def str_to_tuple(x_string):
+def id_to_tuple(node, width):
 	'''
-	'000x000y' --> (x,y)
+	id --> ((x,y), side)
 	'''
-	return (int(x_string[0:4]),int(x_string[4:]))
+	row, col, port = decode(node,width)
+	return (row,col), SIDES[port]
 	
 
 
@@ -117,19 +121,8 @@ def identify_crossing(cell_transition):
 	}
 		
 	'''
-	cell_transition = int(cell_transition)
-	#get the possible actions of the train based on its direction
-	N = format(cell_transition >> (3 * 4) & 0xF, '04b')
-	E = format(cell_transition >> (2 * 4) & 0xF, '04b')
-	S = format(cell_transition >> (1 * 4) & 0xF, '04b')
-	W = format(cell_transition >> (0 * 4) & 0xF, '04b')
-
-	results = {
-		'N':get_direction(N),
-		'E': get_direction(E),
-		'S': get_direction(S),
-		'W':get_direction(W)
-	}
+	#get the possible actions of the train based on its direction (decoding shared with the graph module)
+	results = transition_dict(cell_transition)
 
 
 	#correct for half_turn: indication of an endpoint, flatalnd mistake
@@ -153,6 +146,18 @@ def is_endpoint(dic_transition):
 	return endpoint
 
 
+def get_turn_cells(matrix_transition):
+	'''
+	vectorized is_turn(identify_crossing(cell)) over the whole matrix: a train going north or south
+	can go east or west
+
+	Returns
+	-------
+	np.ndarray of bool of the shape of matrix_transition
+	'''
+	return get_turns(matrix_transition)
+
+
 def is_turn(dic_transition):
 	if 'E' in dic_transition['N'] or 'W' in dic_transition['N'] or 'E' in dic_transition['S'] or 'W' in dic_transition['S']:
 		return True
@@ -196,12 +201,12 @@ def is_wrong_connections(index,graph,matrix_transition):
 	graph : networkx instance of DiGraph
 	'''
 
-	name_node_in_graph = tuple_to_str(index)
+	width = matrix_transition.shape[1]
 	
 	for start in ['a','b']:
 		first_level = []
 		second_level = []
-		s = name_node_in_graph + start
+		s = tuple_to_id(index,width,start)
 
 
 		if is_turn(identify_crossing(matrix_transition[index])):
@@ -210,48 +215,89 @@ def is_wrong_connections(index,graph,matrix_transition):
 				inter = []
 				for n2 in graph.neighbors(n):
 					inter.append(n2)
-					if n2[:-1] == name_node_in_graph:
+					if cell_of(n2) == cell_of(s):
 						return True,[s,n,n2]
 
 		return False,[]
 
 
+def find_wrong_connections(graph, turn_cells):
+	'''
+	vectorized is_wrong_connections over all the turn cells and both of their nodes: the paths of two edges
+	of the low level graph which leave a node of a turn cell and come back to the same cell
+
+	Parameters
+	----------
+	graph : networkx instance of DiGraph, nodes are the ids of src.graph.node_ids
+	turn_cells : np.ndarray of bool, mask of the turn cells (see get_turn_cells)
+
+	Returns
+	-------
+	list of the paths [s, n, n2], the first one found for each wrongly wired node s
+	'''
+	width = turn_cells.shape[1]
+	edges = np.array(list(graph.edges), dtype = np.int64).reshape(-1, 2)
+	edges = edges[np.argsort(edges[:, 0], kind = 'stable')]
+	cells = np.flatnonzero(turn_cells)
+	starts = encode(cells // width, cells % width, 0, width)[:, None] + np.array([SIDE_INDEX[side] for side in SIDES])
+
+	def out_edges(nodes):
+		#rows of edges of the out edges of each node, and the index in nodes of their tail
+		begin = np.searchsorted(edges[:, 0], nodes, side = 'left')
+		counts = np.searchsorted(edges[:, 0], nodes, side = 'right') - begin
+		owner = np.repeat(np.arange(len(nodes)), counts)
+		return begin[owner] + np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts), owner
+
+	#first edges (s, n) leaving the nodes of the turn cells, then the second edges (n, n2)
+	first, _ = out_edges(starts.ravel())
+	second, owner = out_edges(edges[first, 1])
+	pairs = first[owner]
+
+	back = cell_of(edges[second, 1]) == cell_of(edges[pairs, 0])
+	paths = np.stack([edges[pairs, 0], edges[pairs, 1], edges[second, 1]], axis = 1)[back]
+	_, index = np.unique(paths[:, 0], return_index = True)
+	return paths[np.sort(index)].tolist()
+
+
 def swap_if_needed(cell_index,G,matrix_transition):
 
-	node = tuple_to_str(cell_index)
+	width = matrix_transition.shape[1]
+	node = {side : tuple_to_id(cell_index,width,side) for side in SIDES}
 	transitions = identify_crossing(matrix_transition[cell_index])
 	if is_turn(transitions):
 
 		#get all the in and out edges from the internal nodes
-		in_edges_a = G.in_edges(node+'a')
-		out_edges_a = G.out_edges(node+'a') 
+		in_edges_a = G.in_edges(node['a'])
+		out_edges_a = G.out_edges(node['a']) 
 
-		in_edges_b = G.in_edges(node+'b')
-		out_edges_b = G.out_edges(node+'b')
+		in_edges_b = G.in_edges(node['b'])
+		out_edges_b = G.out_edges(node['b'])
 
 		if len(in_edges_a) == 0 or len(in_edges_b) == 0 or len(out_edges_a) == 0 or len(out_edges_b)==0:
 
-			#we swap
-			neighbor_a = set([x[:-1] for x in G.neighbors(node+'a')])
-			neighbor_b = set([x[:-1] for x in G.neighbors(node+'b')])
+			#we swap (the neighbors are kept as their node of side 'a')
+			neighbor_a = set([set_port(x,SIDE_INDEX['a']) for x in G.neighbors(node['a'])])
+			neighbor_b = set([set_port(x,SIDE_INDEX['a']) for x in G.neighbors(node['b'])])
 			common_n = neighbor_a.union(neighbor_b)
 
 
 			swapped = False
 
-			for n in common_n:
+			#in the order of the ids so that the swap done does not depend on the order of the set
+			for n in sorted(common_n):
 				if swapped: 
 					break
 				else:
 					for elt1,elt2 in [('a','b'),('b','a')]:
-						if (node+elt1,n+elt2) in G.edges and (n+elt1,node+elt2) in G.edges and not swapped:
+						n1, n2 = set_port(n,SIDE_INDEX[elt1]), set_port(n,SIDE_INDEX[elt2])
+						if (node[elt1],n2) in G.edges and (n1,node[elt2]) in G.edges and not swapped:
 							swapped = True
 							#remove the old edges
-							G.remove_edge(node+elt1,n+elt2)
-							G.remove_edge(n+elt1,node+elt2)
+							G.remove_edge(node[elt1],n2)
+							G.remove_edge(n1,node[elt2])
 
-							G.add_edge(n+elt1,node+elt1)
-							G.add_edge(node+elt2,n+elt2)
+							G.add_edge(n1,node[elt1])
+							G.add_edge(node[elt2],n2)
 
 	
 
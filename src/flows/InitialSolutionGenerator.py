@@ -10,6 +10,7 @@ import pprint
 
 from src.flows.time_evolving_network import TimeNetwork
 from src.flows.NFirstShortestPaths import PathFinder
+from src.graph.node_ids import source, sink, is_source, is_sink, to_str
 
 
 class InitialSolutionGenerator:
@@ -19,7 +20,8 @@ class InitialSolutionGenerator:
 		Parameters
 		----------
 		ten : TimeNetwork
-			time expanded network with sources and sinks with names are source_0 and sink_0
+			time expanded network with sources and sinks, the ones of commodity k are source(k) and sink(k) 
+			(see src.graph.node_ids)
 		constraints : list of sets
 			constraints the edges (only one edge of each set can be activated at the same time)
 		findConstraints: dict
@@ -40,8 +42,8 @@ class InitialSolutionGenerator:
 
 		#extract and order the sources/sinks 
 		for i in range(numberOfCommodities):
-			self.sources.append("source_"+str(i))
-			self.sinks.append("sink_"+str(i))
+			self.sources.append(source(i))
+			self.sinks.append(sink(i))
 
 		#sanity check 
 		try:
@@ -49,7 +51,7 @@ class InitialSolutionGenerator:
 			test = self.graph.nodes[self.sinks[-1]]
 		except:
 			print(f"you probably fucked up something in the number of sources and sinks (got {numberOfCommodities})")	
-			print(f"Did you check that the names were correct ? I expect something like {self.sources[-1]} and {self.sinks[-1]} but could not find them")
+			print(f"Did you check that the names were correct ? I expect something like {to_str(self.sources[-1],ten.width)} and {to_str(self.sinks[-1],ten.width)} but could not find them")
 			raise ValueError("Error, could not fetch the sources and sinks")
 
 
@@ -146,10 +148,10 @@ class InitialSolutionGenerator:
 		#do not look at the source and sink connected edges since 
 		
 		for edge in p1:
-			if "source" not in edge[0] and "sink" not in edge[1]:
+			if not is_source(edge[0]) and not is_sink(edge[1]):
 				c1 = self.findConstraints[edge]
 				for edge2 in p2:
-					if "source" not in edge2[0] and "sink" not in edge2[1]:
+					if not is_source(edge2[0]) and not is_sink(edge2[1]):
 						c2 = self.findConstraints[edge2]
 						if len([x for x in c1 if x in c2])>0:
 							return True
@@ -2,6 +2,8 @@ import gurobipy
 import numpy as np
 from time import time
 
+from src.graph.node_ids import is_source, is_sink
+
 
 class MasterProblem:
     '''
@@ -62,21 +64,31 @@ class MasterProblem:
             self.PathCommodity[tuple(initialSolution[k])] = (k,0)
 
 
-        self.constraintsActivated = set()
+        #constraints activated by the paths, a constraint id is its index in this list (and the index of its
+        #row among the restrictions of the model)
+        self.constraintsActivated = []
+        #key: constraint (frozenset), item: its id
+        self.constraintIds = {}
          #links constraints (as key) to a list of paths that go through them 
         self.findConstraints_path = {}
 
         for path in self.pathVariables:
             for edge in path:
-                if "source" not in edge[0] and "sink" not in edge[1]:
+                if not is_source(edge[0]) and not is_sink(edge[1]):
                     for c in self.findConstraints_edges[edge]:
-                        self.constraintsActivated.add(frozenset(c))
-                        if frozenset(c) in self.findConstraints_path.keys():
-                            self.findConstraints_path[frozenset(c)].append(self.PathCommodity[tuple(path)])
-                        else:
-                            self.findConstraints_path[frozenset(c)] = [self.PathCommodity[tuple(path)]]
+                        self.__activate(frozenset(c),self.PathCommodity[tuple(path)])
         
        
+    def __activate(self,constraint,column):
+        '''
+        add the column (commodity, pathIndex) to the paths going through constraint, the constraint gets the 
+        next id if it was not activated yet
+        '''
+        if constraint not in self.constraintIds:
+            self.constraintIds[constraint] = len(self.constraintsActivated)
+            self.constraintsActivated.append(constraint)
+            self.findConstraints_path[constraint] = []
+        self.findConstraints_path[constraint].append(column)
 
     def build(self):
         self.generateVariables()
@@ -84,6 +96,10 @@ class MasterProblem:
         self.generateObjective()
         self.model.update()
 
+        #rows of the constraints in the model (same in its relaxation)
+        self.restrictionRows = np.array([c.index for c in self.restrictions], dtype = int)
+        self.unitFlowRows = np.array([self.unitFlow[k].index for k in self.commodities], dtype = int)
+
     def generateVariables(self):
         '''
         create the variables of the master problem, indexed as
@@ -95,18 +111,26 @@ class MasterProblem:
         # we add one variable per path for each commodity
         self.pathVars = self.model.addVars(self.CommodityPath, obj= self.cost, vtype = gurobipy.GRB.BINARY,name = "path")
 
+        #columns in the order of the variables: column -> (commodity, path index)
+        columns = np.array(list(self.CommodityPath.keys()), dtype = int).reshape(-1,2)
+        self.columnCommodity = columns[:,0]
+        self.columnPath = columns[:,1]
+        self.columnVars = [self.pathVars[key] for key in self.CommodityPath]
+
 
     def generateConstraints(self):
 
         # add constraints to respect the external restrictions
         # only iterate trough the constraints activated by the pathVariables we are currently using
-        for i,constraint in enumerate(self.constraintsActivated):
+        # the restriction of id i is self.restrictions[i]
+        self.restrictions = [
             self.model.addConstr(
                 (gurobipy.quicksum(self.pathVars[p] for p in self.findConstraints_path[constraint])<= 1),"Restrictions-"+str(i)
             )
+            for i,constraint in enumerate(self.constraintsActivated)]
 
         #add constraints to have exactly one unit per commodity 
-        self.model.addConstrs((self.pathVars.sum(k,'*') == 1 for k in self.commodities), "unitFlow")
+        self.unitFlow = self.model.addConstrs((self.pathVars.sum(k,'*') == 1 for k in self.commodities), "unitFlow")
      	
 
 
@@ -128,10 +152,11 @@ class MasterProblem:
     def getDualVariables(self):
         '''
         return the dual values of the relaxation of the master LP
-        first are the values linked to the external restrictions (y_R)
+        first are the values linked to the external restrictions (y_R), in the order of constraintsActivated
         the last ones to the commodities (sigma_k)
         '''
-        return self.relaxedModel.getAttr("Pi", self.model.getConstrs())
+        pi = np.array(self.relaxedModel.getAttr("Pi", self.relaxedModel.getConstrs()))
+        return np.concatenate((pi[self.restrictionRows], pi[self.unitFlowRows]))
 
 
     def addColumn(self,pathToAdd):
@@ -149,13 +174,9 @@ class MasterProblem:
                 self.CommodityPath[(commodity,index)] = path
                 self.cost[(commodity,index)] = len(path)
                 for edge in path:
-                    if "source" not in edge[0] and "sink" not in edge[1]:
+                    if not is_source(edge[0]) and not is_sink(edge[1]):
                         for c in self.findConstraints_edges[edge]:
-                            self.constraintsActivated.add(frozenset(c))
-                            if frozenset(c) in self.findConstraints_path.keys():
-                                self.findConstraints_path[frozenset(c)].append((commodity,index))
-                            else:
-                                self.findConstraints_path[frozenset(c)] = [(commodity,index)]
+                            self.__activate(frozenset(c),(commodity,index))
         if skipped == len(list(pathToAdd.keys())):
             print("only adding already added columns")
         self.model = gurobipy.Model("Master Problem")
@@ -166,14 +187,7 @@ class MasterProblem:
         return the paths that are used in form of dictionnary indexed by commodity index
         path are represented as list of edges
         '''
-        paths_to_get = {}
-        for v in self.model.getVars():
-            if v.x == 1:
-                inter = v.VarName.split("[")[-1]
-                inter = inter.split("]")[0]
-                c = int(inter.split(",")[0])
-                path = int(inter.split(",")[-1])
-                paths_to_get[c] = self.CommodityPath[(c,path)]
-
-        return paths_to_get
-        
\ No newline at end of file
+        x = np.array(self.model.getAttr("X", self.columnVars))
+        chosen = np.flatnonzero(x > 0.5)
+        return {c : self.CommodityPath[(c,path)] 
+                for c,path in zip(self.columnCommodity[chosen].tolist(), self.columnPath[chosen].tolist())}
@@ -2,22 +2,48 @@
 # column generation framework
 
 import networkx as nx
+import numpy as np
+from scipy import sparse
 from copy import deepcopy
 
+from src.graph.node_ids import source, sink
+
 class PricingSolver:
 
 	def __init__(self,graph, constraints,findConstraints,numberOfCommodities):
 		self.graph = graph
 		self.__set_sources_sinks(numberOfCommodities)
 		self.findConstraints = findConstraints
+		self.__set_incidence(constraints)
 
 
 	def __set_sources_sinks(self,numberOfCommodities):
 		self.sources = []
 		self.targets = []
 		for i in range(numberOfCommodities):
-			self.sources.append("source_"+str(i))
-			self.targets.append("sink_"+str(i))
+			self.sources.append(source(i))
+			self.targets.append(sink(i))
+
+
+	def __set_incidence(self,constraints):
+		'''
+		number the edges of the graph (edge attribute 'eid', index in self.weights) and the constraints 
+		(self.constraintIndex) and build the sparse transpose of the constraint-edge incidence matrix
+		'''
+		for eid,(u,v) in enumerate(self.graph.edges):
+			self.graph[u][v]['eid'] = eid
+		self.weights = np.ones(self.graph.number_of_edges())
+
+		self.constraintIndex = {}
+		rows, cols = [], []
+		for i,constraint in enumerate(constraints):
+			self.constraintIndex[frozenset(constraint)] = i
+			for edge in constraint:
+				if self.graph.has_edge(*edge):
+					rows.append(self.graph[edge[0]][edge[1]]['eid'])
+					cols.append(i)
+		self.incidenceT = sparse.csr_matrix((np.ones(len(rows)),(rows,cols)),
+											shape = (len(self.weights),len(constraints)))
 
 
 	def get_columns_to_add(self,dualVariables, constraintsAcitvated):
@@ -60,15 +86,17 @@ class PricingSolver:
 
 	def set_weights(self,dualVariables, constraintsActivated):
 		'''
-		Get the weights of the constraints (dual variable from the LP) and set them as attributes of the edges
+		Get the weights of the constraints (dual variable from the LP) and compute the weights of the edges
+		w = 1 - A^T pi, with A the incidence matrix of the constraints and pi the dual variables (0 for the
+		constraints which are not activated), stored in self.weights (indexed by the 'eid' of the edges)
 		'''
 
 		# see remark in the report on non activated constraints to get why 
 		# default value is 0 (then the actual edge weight is 1)
-		nx.set_edge_attributes(self.graph,1,"weight_pricing_problem")
-		for i,constraint in enumerate(constraintsActivated):
-			for edge in constraint:
-				self.graph[edge[0]][edge[1]]["weight_pricing_problem"] -= dualVariables[i]
+		rows = [self.constraintIndex[constraint] for constraint in constraintsActivated]
+		pi = np.zeros(self.incidenceT.shape[1])
+		pi[rows] = np.asarray(dualVariables[:len(rows)])
+		self.weights = 1 - self.incidenceT.dot(pi)
 
 		
 
@@ -79,9 +107,9 @@ class PricingSolver:
 
 		Parameters
 		----------
-		s : string \\
+		s : int \\
 			source node, must be in the graph use for initialization of the Pricing solver\\
-		t : string\\
+		t : int\\
 			sink node, must be in the graph use for initialization of the Pricing solver\\
 		sigma : double
 
@@ -94,7 +122,8 @@ class PricingSolver:
 		'''
 
 		#compute shortest weighted path
-		min_weight_path = nx.shortest_path(self.graph,s,t,"weight_pricing_problem")
+		weights = self.weights
+		min_weight_path = nx.shortest_path(self.graph,s,t,lambda u,v,edge: weights[edge['eid']])
 		min_weight = self.compute_path_length(min_weight_path)
 		
 		if min_weight < sigma:
@@ -104,10 +133,5 @@ class PricingSolver:
 
 
 	def compute_path_length(self,path):
-		total_length = 0
-		for i in range(len(path)-1):
-			source, target = path[i], path[i+1]
-			edge = self.graph[source][target]
-			total_length += edge['weight_pricing_problem']
-
-		return total_length
+		eids = [self.graph[path[i]][path[i+1]]['eid'] for i in range(len(path)-1)]
+		return self.weights[eids].sum()
@@ -1,10 +1,12 @@
 import gurobipy
 import numpy as np
 import networkx as nx
-import copy
 from tqdm import tqdm
 import time
 
+from src.graph.node_ids import is_source, is_sink, commodity_of
+from src.flows.solution import decode_paths, paths_from_cells
+
 class MCFlow:
 
 	def __init__(self, graph,numberOfCommodities, topology, integer = True,verbose = False):
@@ -17,7 +19,8 @@ class MCFlow:
 			Time expanded Network containing a graph
 			
 			graph on which to run the multicommodity flow problem
-			should have source and sink nodes annotated like "source_1", "sink_1" 
+			should have source and sink nodes source(1), sink(1) (see src.graph.node_ids) and the 
+			attributes 'width' and 'stride' of the time expanded network
 			should have edges with both weight and capacity
 
 		numberOfCommodities : int
@@ -38,6 +41,8 @@ class MCFlow:
 		#build the two principal lists
 		self.commodities = np.arange(0,numberOfCommodities)
 		self.nodes = graph.nodes
+		self.width = graph.graph['width']
+		self.stride = graph.graph['stride']
 
 		#get the arcs and the capacity from the graph
 		self.arcs,self.capacity = gurobipy.multidict(self.__get_dict_arcs_capacity(graph))
@@ -58,6 +63,11 @@ class MCFlow:
 		else:
 			self.flow = self.m.addVars(self.commodities, self.arcs, obj = self.cost, name = 'flow')
 
+		#index arrays of the variables: the variable flow_vars[n] is the flow of commodity flow_index[n,0]
+		#on the arc (flow_index[n,1], flow_index[n,2])
+		self.flow_vars = list(self.flow.values())
+		self.flow_index = np.array(list(self.flow.keys()), dtype = np.int64).reshape(-1,3)
+
 		#add the constraint to the model
 		self.__add_constraints(topology)
 
@@ -82,12 +92,12 @@ class MCFlow:
 		print the result if an optimal solution was found
 		'''
 		if self.m.status == gurobipy.GRB.Status.OPTIMAL:
-			solution = self.m.getAttr('x', self.flow)
-			for h in self.commodities:
+			index, values = self.__get_nonzero_flows(0)
+			commodities = np.searchsorted(index[:,0], self.commodities)
+			for h, start, end in zip(self.commodities, commodities, np.append(commodities[1:], len(index))):
 				print('\nOptimal flows for %s:' % h)
-				for i,j in self.arcs:
-					if solution[h,i,j] > 0:
-						print('%s -> %s: %g' % (i, j, solution[h,i,j]))
+				for (_,i,j),value in zip(index[start:end].tolist(), values[start:end].tolist()):
+					print('%s -> %s: %g' % (i, j, value))
 		else:
 			print("model not optimized or failed to optimize \n please use .solve() and check the output")
 
@@ -121,10 +131,10 @@ class MCFlow:
 		inflow = {}
 		for node in self.nodes:
 			for commodity in self.commodities:
-				if node.startswith("source") and int(node.split("_")[-1]) == commodity:
-					inflow[(int(node.split("_")[-1]),node)] = 1
-				elif node.startswith("sink") and int(node.split("_")[-1]) == commodity:
-					inflow[(int(node.split("_")[-1]),node)] = -1
+				if is_source(node) and commodity_of(node) == commodity:
+					inflow[(commodity,node)] = 1
+				elif is_sink(node) and commodity_of(node) == commodity:
+					inflow[(commodity,node)] = -1
 				else:
 					inflow[(commodity,node)] = 0
 
@@ -273,6 +283,24 @@ class MCFlow:
 		'''
 		return self.m.status == gurobipy.GRB.Status.OPTIMAL
 
+	def __get_nonzero_flows(self, threshold):
+		'''
+		read the solution vector once and keep the variables above threshold
+		
+		Returns
+		-------
+		index : (n,3) array
+			commodity, tail and head of the arcs with a flow, sorted by commodity and along the paths (the
+			tail of the first arc of a path is the source, then the ids grow with time, see src.graph.node_ids)
+		values : (n,) array
+			flow on these arcs
+		'''
+		values = np.array(self.m.getAttr(gurobipy.GRB.Attr.X, self.flow_vars))
+		nonzero = np.flatnonzero(values > threshold)
+		index = self.flow_index[nonzero]
+		order = np.lexsort((index[:,1], index[:,0]))
+		return index[order], values[nonzero][order]
+
 	def __extract_paths(self):
 		'''
 		extract the path from the LP into a sequence of visited vertex in the time expanded network
@@ -287,45 +315,19 @@ class MCFlow:
 		if self.__check_if_feasible():
 			paths = {}
 
-			#get the solution
-			solution = self.m.getAttr('x', self.flow)
-
-			#get the path for each commodities
-			for k in self.commodities:
-				paths[k] = []
-				self.solution_complete_edges[k] = []
-				for i,j in self.arcs:
-					if solution[k,i,j] == 1:
-						if i.startswith("source"):
-						 	paths[k].append(j)
-						elif j.startswith("sink"):
-						 	paths[k].append(i)
-						else:
-							self.solution_complete_edges[k].append((i,j))
-							paths[k].append(i)
-							paths[k].append(j)
-						
-
-
-			for k,path in paths.items():
-				path.sort(key=lambda x: int(x.split("_t")[-1]))
-				one_endpoint_seen = {}
-				clean_path = []
-				for elt in path:
-					if elt not in one_endpoint_seen.keys():
-						one_endpoint_seen[elt] = True
-						clean_path.append(elt)
-					else:
-						if not one_endpoint_seen[elt]:
-							clean_path.append(elt)
-						one_endpoint_seen[elt] = not one_endpoint_seen[elt]
-
-
-				paths[k] = clean_path
+			#get the arcs used, the variables are binary (up to the tolerance of the solver)
+			index, _ = self.__get_nonzero_flows(0.5)
+			commodity, tail, head = index.T
+			inner = ~is_source(tail) & ~is_sink(head)
 
+			#get the path for each commodities: the nodes visited without the source and the sink
+			commodities = np.searchsorted(commodity, self.commodities)
+			for k, start, end in zip(self.commodities, commodities, np.append(commodities[1:], len(index))):
+				heads = head[start:end]
+				paths[k] = heads[~is_sink(heads)].tolist()
+				edges = index[start:end][inner[start:end],1:]
+				self.solution_complete_edges[k] = list(map(tuple, edges.tolist()))
 
-			
-										
 			return paths
 		else:
 			print("model not optimized or failed to optimize \n please use .solve() and check the output")
@@ -343,29 +345,11 @@ class MCFlow:
 		
 		Returns
 		-------
-		dict			
+		dict
+			agent -> list of the cells (row, col) at each time step (see src.flows.solution)
 		'''
-		paths = copy.deepcopy(paths_old)
-		paths_coord = {}
-		for agent ,path in paths.items():
-			seen = {}
-			clean_path = []
-			for elt in path:
-				if elt.startswith("source") or elt.startswith("sink"):
-					pass
-				else:
-					cell_name = elt.split("_")[0]
-					if cell_name not in seen.keys():
-						seen[cell_name] = 1
-						clean_path.append(cell_name)
-					else:
-						seen[cell_name] += 1
-						if seen[cell_name]%2 != 0:
-							clean_path.append(cell_name)
-			paths_coord[agent] = clean_path
-							
-					
-		return paths_coord
+		agents, cells, _, lengths = decode_paths(paths_old,self.stride)
+		return dict(zip(agents.tolist(),paths_from_cells(cells,lengths,self.width)))
 
 	def check_no_collisions_solution(self,paths):
 		'''
@@ -0,0 +1,84 @@
+'''
+decoding of the solutions of the routing problem into arrays
+
+a path of the time expanded network visits one node per layer: the node at index t of the path is at time t.
+One time step of flatland spans two layers (out node of a cell, in node of the next cell), so the cell of
+an agent at the flatland time step i is the one of the node at time 2i (and the last node of the path ends
+it). The paths of all the agents are decoded at once into (agents x T) arrays of cell ids (row * W + col,
+see src.graph.node_ids.cell_of) and of directions of the agents (0 = North, 1 = East, 2 = South, 3 = West)
+'''
+import numpy as np
+
+from src.graph.node_ids import cell_of, port_of, static_of, is_sink
+
+#direction of an agent on a node indexed by the port of the node (see node_ids.PORTS): the agent
+#leaves its cell through an out node and came in through the opposite side of an in node
+DIRECTION_OF_PORT = np.array([2,0,3,1,1,3,0,2])
+
+
+def nodes_of_edge_paths(paths):
+	'''
+	nodes of the time expanded network visited by paths of edges, without the sources and sinks
+
+	Parameters
+	----------
+	paths : dict
+		commodity -> list of edges from the source to the sink (e.g. MasterProblem.get_solution())
+
+	Returns
+	-------
+	dict
+		commodity -> list of nodes
+	'''
+	return {c : [edge[1] for edge in path if not is_sink(edge[1])] for c,path in paths.items()}
+
+
+def decode_paths(paths, stride):
+	'''
+	decode the paths of all the commodities in one vectorized step
+
+	Parameters
+	----------
+	paths : dict
+		commodity -> list of the nodes of the time expanded network visited by its path, without the
+		source and the sink, in any order (e.g. nodes_of_edge_paths or MCFlow.solution_complete)
+	stride : int
+		stride of the time expanded network
+
+	Returns
+	-------
+	agents : (agents,) commodities in the order of the rows of the arrays (sorted)
+	cells : (agents x T) cell id of each agent at each time step, -1 after the end of its path
+	directions : (agents x T) direction of each agent at each time step, -1 after the end of its path
+	lengths : (agents,) number of time steps of each path
+	'''
+	agents = np.array(sorted(paths.keys()), dtype = np.int64)
+	number_nodes = np.array([len(paths[k]) for k in agents.tolist()], dtype = np.int64)
+	lengths = np.where(number_nodes > 0, number_nodes // 2 + 1, 0)
+	horizon = int(lengths.max()) if len(agents) > 0 else 0
+	cells = np.full((len(agents), horizon), -1, dtype = np.int64)
+	directions = np.full((len(agents), horizon), -1, dtype = np.int64)
+	if horizon == 0:
+		return agents, cells, directions, lengths
+
+	owner = np.repeat(np.arange(len(agents)), number_nodes)
+	nodes = np.concatenate([np.asarray(paths[k], dtype = np.int64) for k in agents.tolist()])
+	#the ids of the time expanded network grow with time
+	nodes = nodes[np.lexsort((nodes, owner))]
+	index = np.arange(len(nodes)) - np.repeat(np.cumsum(number_nodes) - number_nodes, number_nodes)
+
+	#keep the nodes at even times and the last node of each path
+	keep = (index % 2 == 0) | (index == number_nodes[owner] - 1)
+	steps = (index[keep] + 1) // 2
+	static = static_of(nodes[keep], stride)
+	cells[owner[keep], steps] = cell_of(static)
+	directions[owner[keep], steps] = DIRECTION_OF_PORT[port_of(static)]
+	return agents, cells, directions, lengths
+
+
+def paths_from_cells(cells, lengths, width):
+	'''
+	list of the paths of cells (row, col) of each row of the arrays returned by decode_paths
+	'''
+	rows, cols = np.divmod(cells, width)
+	return [list(zip(rows[k,:n].tolist(), cols[k,:n].tolist())) for k,n in enumerate(lengths.tolist())]
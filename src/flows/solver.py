@@ -5,20 +5,16 @@ from src.flows.PricingProblem import PricingSolver
 from src.flows.InitialSolutionGenerator import InitialSolutionGenerator
 from src.flows.MasterProblem import MasterProblem
 from src.flows.lp_formulation import MCFlow
-from src.navigation.navigation_path import walk_many_paths
+from src.navigation.navigation_path import walk_many_paths, replay_paths
+from src.flows.solution import nodes_of_edge_paths, decode_paths, paths_from_cells
+from src.graph.node_ids import static_of, is_source, is_sink
 
 import numpy as np
 import pandas as pd
 import logging
 import time
 import gurobipy 
-import collections
 
-def parse_tuple_from_txt(tuple_str):
-    interest = tuple_str.split("_")[0]
-    interest_left = interest.split("(")[1].split(",")[0]
-    interest_right = interest.split(")")[0].split(",")[1]
-    return (int(interest_left),int(interest_right))
 class Solver:
 
 	def __init__(self, logfile, method = "Column Generation",useDirections = False, useSpeeds = False,verbose = True):
@@ -73,7 +69,7 @@ class Solver:
 			self.setup_arc_formulation()
 		self.logger.info("Building completed")
 
-	def solve(self,env,timeHorizon = None):
+	def solve(self,env,timeHorizon = None, results_writer = None):
 		'''
 		solve the multicommodity flow problem and keep the results in memory
 		
@@ -82,6 +78,8 @@ class Solver:
 		env : Flatland environment
 		timeHorizon : int
 			the length to build the time expanded network
+		results_writer : ResultsWriter, optional
+			if given a record of the run is written to it (see src.benchmark.results), by default None
 
 		Returns
 		-------
@@ -102,12 +100,38 @@ class Solver:
 		self.logger.info("Solving")
 
 		if self.method == "Column Generation":
-			return self.appply_column_generation()
+			score = self.appply_column_generation()
 		elif self.method == "Arc Formulation":
-			return self.apply_arc_formulation()
+			score = self.apply_arc_formulation()
 		else:
 			raise ValueError(f"unknown method {method} to solve the mc flow problem."+
 				 "\\Column Generation or  Arc Formulation are implemented.")
+
+		if results_writer is not None:
+			results_writer.write(self.get_record(env,score))
+		return score
+
+	def get_record(self,env,score):
+		'''
+		record of the last run for a ResultsWriter, the columns have the same type for both methods so that
+		the files of the dataset have the same schema (NaN initial solution time and no variables added for
+		the Arc Formulation)
+		'''
+		#imported here so that pandas and pyarrow are only needed to write results
+		from src.benchmark.results import grid_size
+		record = {"method": self.method,
+				  "grid_size": grid_size(env.width,env.height),
+				  "width": env.width,
+				  "height": env.height,
+				  "agents": self.numberOfCommodities,
+				  "score": float(score),
+				  "time": self.stats["running time"],
+				  "time initial solution": float("nan"),
+				  "variables added": 0}
+		if self.method == "Column Generation":
+			record["time initial solution"] = float(self.stats["timeInit"])
+			record["variables added"] = int(sum(self.master.stats["variablesAdded"]))
+		return record
 		
 
 	def agents_information(self, env):
@@ -195,7 +219,7 @@ class Solver:
 			print(f"score: {self.mcflow.m.objVal}")
 		self.logger.info("finished solving with arc formulation")
 		self.stats["running time"] = time.time()- self.stats["running time"]
-		self.solution_cell = self.mcflow.get_paths_solution()
+		self.decode_solution(self.mcflow.solution_complete)
 		return self.mcflow.m.objVal
 
 	def appply_column_generation(self):
@@ -228,26 +252,32 @@ class Solver:
 		self.stats["running time"] = time.time()- self.stats["running time"]
 		if self.verbose:
 			print(f"score: {self.master.model.objVal}")
-		self.solution_edge = self.translate_edges_ten_to_edge_transition(self.master.get_solution())
-		self.solution_cell = self.translate_edges_ten_to_cell_list(self.master.get_solution())
+		solution = self.master.get_solution()
+		self.solution_edge = self.translate_edges_ten_to_edge_transition(solution)
+		self.decode_solution(nodes_of_edge_paths(solution))
 		self.logger.info("finished solving integer formulation")
 		
 		return self.master.model.objVal
 
 	
-	def translate_edges_ten_to_cell_list(self,paths_dict):
-		result = {}
-		for c,path in paths_dict.items():
-			inter_list = [parse_tuple_from_txt(x[1].split("_t")[0]) for x in path if not x[1].startswith("sink")]
-			result[c] = [inter_list[2*i] for i in range(int(len(inter_list)/2))]
-			result[c].append(inter_list[-1])
-		return result
+	def decode_solution(self,node_paths):
+		'''
+		decode the paths of the solution (dict commodity -> nodes of the time expanded network, see 
+		src.flows.solution.decode_paths) into the arrays solution_cells and solution_directions 
+		(commodities x time steps, rows in the order of solution_agents), and the dict solution_cell
+		(commodity -> list of cells)
+		'''
+		decoded = decode_paths(node_paths,self.timeExpandedNetwork.stride)
+		self.solution_agents, self.solution_cells, self.solution_directions, self.solution_lengths = decoded
+		paths = paths_from_cells(self.solution_cells,self.solution_lengths,self.timeExpandedNetwork.width)
+		self.solution_cell = dict(zip(self.solution_agents.tolist(),paths))
 
 
 	def translate_edges_ten_to_edge_transition(self,paths_dict):
 		result = {}
+		stride = self.timeExpandedNetwork.stride
 		for c,path in paths_dict.items():
-			result[c] = [(x[0].split("_t")[0],x[1].split("_t")[0]) for x in path if not x[0].startswith("source") and not x[1].startswith("sink")]
+			result[c] = [(static_of(x[0],stride),static_of(x[1],stride)) for x in path if not is_source(x[0]) and not is_sink(x[1])]
 		return result
 
 
@@ -264,11 +294,23 @@ class Solver:
 				paths_to_run.append([])
 		return paths_to_run
 
-	def run(self,env,envRenderer):
+	def run(self,env,envRenderer = None):
+		'''
+		make the agents of env walk the paths of the solution
+
+		Parameters
+		----------
+		env : Flatland environment
+		envRenderer : RenderTool, optional
+			if None the solution is replayed without rendering and the divergences from the plan 
+			are returned as an array of (agent, time), by default None
+		'''
 		self.clean_env(env,self.to_drop)
-		paths = [path for _,path in collections.OrderedDict(sorted(self.solution_cell.items())).items()]
+		paths = paths_from_cells(self.solution_cells,self.solution_lengths,self.timeExpandedNetwork.width)
 		for elt in self.dropped:
 			paths.insert(elt,[])
+		if envRenderer is None:
+			return replay_paths(env,paths,verbose = self.verbose)
 		walk_many_paths(env,envRenderer,paths)
 
 
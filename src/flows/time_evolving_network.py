@@ -1,12 +1,10 @@
 import networkx as nx
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import numpy as np
 
-def parse_tuple_from_txt(tuple_str):
-    interest = tuple_str.split("_")[0]
-    interest_left = interest.split("(")[1].split(",")[0]
-    interest_right = interest.split(")")[0].split(",")[1]
-    return (int(interest_left),int(interest_right))
+from src.graph.node_ids import (encode, cell_index, cell_of, at_time, time_of, static_of, get_stride,
+								source, sink, is_source, is_sink, commodity_of, to_str, rows_of, N_PORTS, PORT_INDEX)
 
 
 COLORS = ['b','g','r','c','m','y']
@@ -18,6 +16,13 @@ class TimeNetwork:
 	'''
 	Implementation of a time connected network
 
+	the node n of the original graph (a NetworkGraph, nodes are the ids of src.graph.node_ids) at time t 
+	is the int at_time(n,t,self.stride), the source and sink of commodity k are source(k) and sink(k). 
+	The width and the stride are also stored in the attributes of self.graph ('width' and 'stride')
+
+	the positions of the nodes for plotting are computed from the ids (see get_positions), the arrays 
+	layout_nodes, layout and layout_edges are computed once the network is built (see compute_layout)
+
 	Examples
 	--------
 	\\>> graph = nx.complete_graph(100)
@@ -48,7 +53,9 @@ class TimeNetwork:
 		incoming_graph_data.remove_nodes_from(list(nx.isolates(incoming_graph_data)))
 		
 		self.depth = depth
-		self.graph = nx.DiGraph()
+		self.width = graph_data.size[1]
+		self.stride = get_stride(graph_data.size)
+		self.graph = nx.DiGraph(width = self.width, stride = self.stride)
 
 
 		self.topology_position = {}
@@ -68,7 +75,11 @@ class TimeNetwork:
 																	waiting_capacity = waiting_capacity)
 
 		#take the cell index for the flatland graph
-		self.list_cells = [parse_tuple_from_txt(x) for x in self.list_nodes]
+		self.list_cells = [cell_index(x,self.width) for x in self.list_nodes]
+
+		#x coordinate of each node of the original graph for plotting (its index in list_nodes)
+		self.layout_x = np.full(self.stride, -1.)
+		self.layout_x[np.array(self.list_nodes, dtype = np.int64)] = np.arange(len(self.list_nodes))
 		
 		#connect the two layers
 		self.graph.update(self.block)
@@ -79,13 +90,15 @@ class TimeNetwork:
 			self.build_new_depth_network()
 
 		self.compute_topology_network(graph_data)
+		self.compute_layout()
 
 
 	def connect_sources_and_sink(self, sources, sinks, directions = None):
 		'''
 		given a list of cells of sources and sinks,
-		connect them to the graph in the followin manner: the source is attached at time t=0,
-		while the sink is attached to all the time step > 1
+		connect them to the graph in the followin manner: the source is attached at time t=0 (to the out
+		nodes of its cell, only the one of the direction of the agent if directions is given),
+		while the sink is attached to all the time step >= 1 (to the in nodes of its cell)
 		
 		Parameters
 		----------
@@ -116,32 +129,81 @@ class TimeNetwork:
 
 		number_nodes = len(list(self.block.nodes))/2
 
-		for agent, (source,sink) in enumerate(zip(sources,sinks)):
+		#ports of the in nodes of a cell, the out nodes are the next ones
+		in_ports = np.arange(0,N_PORTS,2)
+		times = np.arange(1,self.last_time_step)
+
+		for agent, (source_cell,sink_cell) in enumerate(zip(sources,sinks)):
 
 			#define node names
-			source_name = "source_"+str(agent)
-			sink_name = "sink_"+str(agent)
+			source_name = source(agent)
+			sink_name = sink(agent)
 
 			#add the nodes to the graph
-			self.graph.add_node(source_name,pos = [agent,-1])
-			self.graph.add_node(sink_name,pos = [number_nodes +5 ,self.depth + agent+0.2])
-
-			#connect the source and sink nodes
-			for node in self.graph.nodes:
-				if node.startswith(str(source)) and "out" in node and  node.endswith("t0") :
-					if directions is None:
-						self.graph.add_edge(source_name,node, capacity = 1, weight = 1)
-						numbersConnection += 1
-					else:
-						if ORIENTATION_INBOUND[directions[agent]] in node:
-							self.graph.add_edge(source_name,node, capacity = 1, weight = 1)
-							numbersConnection += 1
-
-				if node.startswith(str(sink)) and 'in' in node and not node.endswith("t0"):
+			self.graph.add_node(source_name)
+			self.graph.add_node(sink_name)
+
+			#connect the source to the out nodes at time 0 (same ids as in the original graph)
+			if directions is None:
+				out_ports = in_ports + 1
+			else:
+				out_ports = np.array([PORT_INDEX[ORIENTATION_INBOUND[directions[agent]] + "_out"]])
+			for node in encode(source_cell[0],source_cell[1],out_ports,self.width).tolist():
+				if node in self.graph:
+					self.graph.add_edge(source_name,node, capacity = 1, weight = 1)
+					numbersConnection += 1
+
+			#connect the in nodes at all the time steps but the first to the sink
+			in_nodes = encode(sink_cell[0],sink_cell[1],in_ports,self.width)
+			for node in at_time(in_nodes[None,:],times[:,None],self.stride).ravel().tolist():
+				if node in self.graph:
 					self.graph.add_edge(node,sink_name, capacity = 1, weight = 1)
 		if numbersConnection < len(sources):
 			print("Error, not all sources were connected")		
 
+		self.compute_layout()
+
+
+	def get_positions(self, nodes):
+		'''
+		(n,2) positions for plotting of an array of node ids: (index in list_nodes, time) for the nodes 
+		of the layers, (k,-1) for source(k) and (number of nodes + 5, depth + k + 0.2) for sink(k)
+		'''
+		nodes = np.asarray(nodes, dtype = np.int64)
+		static = static_of(nodes,self.stride)
+		positions = np.stack([self.layout_x[static], time_of(nodes,self.stride)], axis = -1).astype(float)
+		commodities = commodity_of(nodes)
+		sources, sinks = is_source(nodes), is_sink(nodes)
+		positions[sources,0] = commodities[sources]
+		positions[sources,1] = -1
+		positions[sinks,0] = len(self.list_nodes) + 5
+		positions[sinks,1] = self.depth + commodities[sinks] + 0.2
+		return positions
+
+
+	def compute_layout(self):
+		'''
+		compute the arrays used for plotting
+
+		layout_nodes : (n,) sorted node ids of self.graph
+		layout : (n,2) positions of the nodes (see get_positions)
+		layout_edges : (m,2) rows in layout_nodes of the endpoints of the edges
+		'''
+		self.layout_nodes = np.sort(np.array(list(self.graph.nodes), dtype = np.int64))
+		self.layout = self.get_positions(self.layout_nodes)
+		self.layout_edges = self.get_rows(list(self.graph.edges))
+
+
+	def get_rows(self, nodes):
+		'''
+		rows in the layout arrays of nodes (array of node ids of any shape, e.g. (m,2) for edges), raises a
+		KeyError if a node is not in the graph
+		'''
+		nodes = np.asarray(nodes, dtype = np.int64)
+		if nodes.size == 0:
+			return np.zeros((0,2), dtype = np.int64)
+		return rows_of(self.layout_nodes, nodes)
+
 
 
 
@@ -187,13 +249,13 @@ class TimeNetwork:
 
 			#keep track of the old name in the graph
 			old_name = node
-			list_nodes.append(str(old_name))
+			list_nodes.append(old_name)
 
 			#add the nodes for one time step
-			name_time_t = str(node)+"_t" + str(t)
-			name_time_t_1 = str(node)+"_t" + str(t+1)
-			basis_layer.add_node(name_time_t,type_node = type_node,old_name = old_name, pos = (i,t))
-			basis_layer.add_node(name_time_t_1,type_node = type_node,old_name = old_name, pos = (i,t+1))
+			name_time_t = at_time(node,t,self.stride)
+			name_time_t_1 = at_time(node,t+1,self.stride)
+			basis_layer.add_node(name_time_t,type_node = type_node,old_name = old_name)
+			basis_layer.add_node(name_time_t_1,type_node = type_node,old_name = old_name)
 
 			#add a waiting edge between them if needed
 			if waiting_cost is not None:
@@ -217,7 +279,7 @@ class TimeNetwork:
 				new_data_edge['weight'] = 1
 
 			#get the updated endpoints for the graph
-			basis_layer.add_edges_from([(str(edge[0])+"_t"+str(t),str(edge[1])+"_t"+str(t+1))],**new_data_edge)
+			basis_layer.add_edges_from([(at_time(edge[0],t,self.stride),at_time(edge[1],t+1,self.stride))],**new_data_edge)
 
 		#update the number of layer existing
 		self.last_time_step += 2
@@ -241,18 +303,18 @@ class TimeNetwork:
 				c_time = set()
 				for edge in c:
 					#transitions 
-					c_time.add((edge[0]+"_t"+str(i),edge[1]+"_t"+str(i+1)))
+					c_time.add((at_time(edge[0],i,self.stride),at_time(edge[1],i+1,self.stride)))
 					#stay in place
-					if edge[0].split("_")[0] == edge[1].split("_")[0]:
-						c_time.add((edge[0]+"_t"+str(i),edge[0]+"_t"+str(i+1)))
-						c_time.add((edge[1]+"_t"+str(i),edge[1]+"_t"+str(i+1)))
+					if cell_of(edge[0]) == cell_of(edge[1]):
+						c_time.add((at_time(edge[0],i,self.stride),at_time(edge[0],i+1,self.stride)))
+						c_time.add((at_time(edge[1],i,self.stride),at_time(edge[1],i+1,self.stride)))
 
 				topology_position[i][cell] = c_time
 
 			for cell,c in swappingConstraints.items():
 				c_time = set()
 				for edge in c:
-					c_time.add((edge[0]+"_t"+str(i),edge[1]+"_t"+str(i+1)))
+					c_time.add((at_time(edge[0],i,self.stride),at_time(edge[1],i+1,self.stride)))
 				topology_swapping[i][cell] = c_time
 		
 		
@@ -309,11 +371,11 @@ class TimeNetwork:
 				new_data_edge['weight'] = self.default_weight
 
 			#get the updated endpoints for the graph
-			old_name_node_from = edge[0].split("_t")[0]
-			old_name_node_to = edge[1].split("_t")[0]
+			old_name_node_from = static_of(edge[0],self.stride)
+			old_name_node_to = static_of(edge[1],self.stride)
 
-			new_name_node_from = old_name_node_from+"_t"+str(self.last_time_step-1)
-			new_name_node_to = old_name_node_to +"_t"+str(self.last_time_step)
+			new_name_node_from = at_time(old_name_node_from,self.last_time_step-1,self.stride)
+			new_name_node_to = at_time(old_name_node_to,self.last_time_step,self.stride)
 
 			self.graph.add_edges_from([(new_name_node_from,new_name_node_to)],**new_data_edge)
 
@@ -328,8 +390,6 @@ class TimeNetwork:
 		layer_nodes = [self.update_time_stamp_names(x) for x in self.list_nodes]
 		layer = nx.DiGraph()
 		layer.add_nodes_from(layer_nodes)
-		for i,node in enumerate(layer.nodes):
-			layer.node[node]['pos'] = (i,int(node.split("_t")[-1]))
 		return layer
 
 
@@ -338,7 +398,7 @@ class TimeNetwork:
 		update the time stamp of name 
 		'''
 		t = self.last_time_step
-		name_updated = name + "_t" + str(t)
+		name_updated = at_time(name,t,self.stride)
 		return name_updated
 
 
@@ -355,18 +415,23 @@ class TimeNetwork:
 		longueur = min(int(3*(self.depth+1)),20)
 		fig = plt.figure(figsize=(largeur,longueur))
 		plt.rcParams['axes.facecolor'] = '#2e3037'
-		pos=nx.get_node_attributes(self.graph,'pos')
-		
-		weights = nx.get_edge_attributes(self.graph,'weight')
-		capacities = nx.get_edge_attributes(self.graph,'capacity')
-		labels = {}
-		if details:
-			for key in weights.keys():
-				labels[key] = (weights[key],capacities[key])
-		nx.draw(self.graph,pos, with_labels = details)
+		ax = plt.gca()
+
+		ax.add_collection(LineCollection(self.layout[self.layout_edges], colors = 'k', linewidths = 1))
+		ax.scatter(self.layout[:,0], self.layout[:,1], s = 300, zorder = 2)
 		if paths is not None:
 			for agent,path in paths.items():
-				nx.draw_networkx_edges(self, pos,
-						edgelist=path,
-						width=10, alpha=1, edge_color=COLORS[int(agent)])
-		_ = nx.draw_networkx_edge_labels(self.graph,pos,edge_labels=labels)
+				ax.add_collection(LineCollection(self.layout[self.get_rows(path)], linewidths=10, alpha=1, 
+												 colors=COLORS[int(agent)]))
+		ax.autoscale_view()
+		ax.set_axis_off()
+
+		if details:
+			#the labels need a dict of positions, only built when they are shown
+			pos = dict(zip(self.layout_nodes.tolist(), self.layout))
+			weights = nx.get_edge_attributes(self.graph,'weight')
+			capacities = nx.get_edge_attributes(self.graph,'capacity')
+			labels = {key: (weights[key],capacities[key]) for key in weights.keys()}
+			node_labels = {n: to_str(n,self.width,self.stride) for n in self.graph.nodes}
+			nx.draw_networkx_labels(self.graph, pos, labels = node_labels, ax = ax)
+			_ = nx.draw_networkx_edge_labels(self.graph,pos,edge_labels=labels, ax = ax)
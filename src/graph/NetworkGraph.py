@@ -1,6 +1,10 @@
 import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+
+from src.graph.transitions import transition_dict
+from src.graph.node_ids import encode, decode, cell_index, is_out, static_of, get_stride, rows_of, PORTS, PORT_INDEX
 
 # GLOBAL VARIBALES
 TRAD_DIRECTION = {
@@ -30,19 +34,26 @@ JITTER = {
 			'S_out':[2,1]
 }
 
+#jitter of the ports in the order of node_ids.PORTS
+PORT_JITTER = np.array([JITTER[port] for port in PORTS])
+
 COLORS = ['b','g','r','c','m','y']
 
-def parse_tuple_from_txt(tuple_str):
-    interest = tuple_str.split("_")[0]
-    interest_left = interest.split("(")[1].split(",")[0]
-    interest_right = interest.split(")")[0].split(",")[1]
-    return (int(interest_left),int(interest_right))
 
+def get_positions(nodes, width, jitter = 0.1):
+	'''
+	positions for pretty plotting of an array of node ids, (n,2) array of (x,y)
+	'''
+	rows, cols, ports = decode(np.asarray(nodes), width)
+	return np.stack([cols + jitter*PORT_JITTER[ports,0], -(rows - jitter*PORT_JITTER[ports,1])], axis = -1)
 
 
 class NetworkGraph(nx.DiGraph):
 	'''
 	implementation of the graph extracted from a flatland network
+
+	the nodes are the int ids of src.graph.node_ids (8 ports per cell, see SuperNode), use node_ids.to_str 
+	with self.width to display them
 	'''
 	
 
@@ -56,6 +67,9 @@ class NetworkGraph(nx.DiGraph):
 		self.sources = sources
 		self.sinks = sinks
 		self.size = transition_matrix.shape
+		self.width = self.size[1]
+		#number of ids of one time step in a time expanded network of this graph
+		self.stride = get_stride(self.size)
 		self.graph_connectivity = nx.DiGraph()
 		self.build(transition_matrix)
 		
@@ -80,6 +94,48 @@ class NetworkGraph(nx.DiGraph):
 		#print a warning if the sanity check was not passed
 		self.sanity_check()
 
+		self.compute_layout()
+
+	def compute_layout(self, jitter = 0.1):
+		'''
+		compute once the arrays used for plotting
+
+		layout_nodes : (n,) sorted node ids
+		layout : (n,2) positions of the nodes (see get_positions)
+		layout_edges : (m,2) rows in layout_nodes of the endpoints of the edges
+		'''
+		self.layout_jitter = jitter
+		self.layout_nodes = np.sort(np.array(list(self.nodes), dtype = np.int64))
+		self.layout = get_positions(self.layout_nodes, self.width, jitter)
+		self.layout_edges = self.get_rows(list(self.edges))
+
+	def get_rows(self, nodes):
+		'''
+		rows in the layout arrays of nodes (array of node ids of any shape, e.g. (m,2) for edges), raises a
+		KeyError if a node is not in the graph
+		'''
+		nodes = np.asarray(nodes, dtype = np.int64)
+		if nodes.size == 0:
+			return np.zeros((0,2), dtype = np.int64)
+		return rows_of(self.layout_nodes, nodes)
+
+	def get_layout(self, jitter = 0.1):
+		'''
+		(n,2) positions of layout_nodes, the cached ones if jitter is the one of compute_layout
+		'''
+		if jitter == self.layout_jitter:
+			return self.layout
+		return get_positions(self.layout_nodes, self.width, jitter)
+
+	def draw_layout(self, ax, layout, node_size = 20):
+		'''
+		draw the edges as one LineCollection and the nodes as one scatter on the axes ax
+		'''
+		ax.add_collection(LineCollection(layout[self.layout_edges], colors = 'k', linewidths = 1))
+		ax.scatter(layout[:,0], layout[:,1], s = node_size, zorder = 2)
+		ax.autoscale_view()
+		ax.set_axis_off()
+
 	def sanity_check(self):
 		'''
 		perform a simple sanity check on the graph extracted from the environment
@@ -109,7 +165,7 @@ class NetworkGraph(nx.DiGraph):
 				transition_dict = self.__get_transition_dictionnary(cell)
 
 				#initialize the superNode corresponding to this cell
-				superNode = SuperNode(index,transition_dict)
+				superNode = SuperNode(index,transition_dict,self.width)
 				self.position_constraints[superNode.name] = superNode.get_constraints()
 				self.superNodes[index] = superNode
 						
@@ -203,7 +259,7 @@ class NetworkGraph(nx.DiGraph):
 			else:
 				raise ValueError(f"trying to connect the same superNode with itself {index1}")
 
-			edge = (superNode_from.name+"_"+connection_out,superNode_to.name +"_"+connection_in)
+			edge = (superNode_from.get_node(connection_out),superNode_to.get_node(connection_in))
 
 			#add incoming edge to the position constraints
 			self.position_constraints[superNode_to.name].append(edge)
@@ -244,29 +300,9 @@ class NetworkGraph(nx.DiGraph):
 		}
 			
 		'''
-		
-		#conversion from binary to list of directions
-		def get_direction(binary_4):
-			results = []
-			for i, elt in enumerate(binary_4):
-				if elt == '1':
-					results.append(TRAD_DIRECTION[i])
-			return results
-
 
-		cell_transition = int(cell_transition)
 		#get the possible actions of the train based on its direction
-		N = format(cell_transition >> (3 * 4) & 0xF, '04b')
-		E = format(cell_transition >> (2 * 4) & 0xF, '04b')
-		S = format(cell_transition >> (1 * 4) & 0xF, '04b')
-		W = format(cell_transition >> (0 * 4) & 0xF, '04b')
-
-		results = {
-			'N':get_direction(N),
-			'E': get_direction(E),
-			'S': get_direction(S),
-			'W':get_direction(W)
-		}
+		results = transition_dict(cell_transition)
 
 		#add minor correction for endpoint
 		if supernode:
@@ -323,12 +359,10 @@ class NetworkGraph(nx.DiGraph):
 		
 		Parameters
 		----------
-		node : str
-			name of the node in the graph
+		node : int
+			id of the node in the graph
 		'''
-		
-		inter = node.split("_")[0]
-		return (int(inter[1]),int(inter[4]))
+		return cell_index(node,self.width)
 
 		
 		
@@ -357,18 +391,9 @@ class NetworkGraph(nx.DiGraph):
 		node : node of nx.DiGraph
 			obtained from G.ndoes()
 		'''
-		# print(node)
-		#get the cell index
-		cell_index = parse_tuple_from_txt(node)
-		#get the "port"
-		subname = "_".join(node.split("_")[-2:])
-
-		#comput the position
-		position_node = (cell_index[0] - jitter*JITTER[subname][1], 
-						cell_index[1] + jitter*JITTER[subname][0])
-		# print(position_node)
-		# print("\n")
-		return (position_node[1],-position_node[0])
+		if jitter == self.layout_jitter:
+			return tuple(self.layout[self.get_rows(node)])
+		return tuple(get_positions(node,self.width,jitter))
 
 
 	def show(self, jitter = 0.1, title = None, paths = None):	
@@ -376,17 +401,16 @@ class NetworkGraph(nx.DiGraph):
 		pretty plotting of the network graph
 		'''
 		plt.figure(figsize=(12,6))
-		node_color = 'steel_blue'
-		pos = dict( (n, self.position(n, jitter)) for n in self.nodes() )
+		ax = plt.gca()
+		layout = self.get_layout(jitter)
 		if paths is None:
-			nx.draw(self ,pos,with_labels = False, node_size=20)
+			self.draw_layout(ax, layout, node_size=20)
 		else:
-			nx.draw(self ,pos,with_labels = False, node_size=1)
+			self.draw_layout(ax, layout, node_size=1)
 		if paths is not None:
 			for agent,path in paths.items():
-				nx.draw_networkx_edges(self, pos,
-						edgelist=[(x[0].split("_t")[0],x[1].split("_t")[0]) for x in path],
-						width=10, alpha=1, edge_color=COLORS[int(agent)])
+				edges = self.get_rows([(static_of(x[0],self.stride),static_of(x[1],self.stride)) for x in path])
+				ax.add_collection(LineCollection(layout[edges], linewidths=10, alpha=1, colors=COLORS[int(agent)]))
 		if title is not None:
 			plt.savefig(title)
 		plt.show()
@@ -403,15 +427,15 @@ class NetworkGraph(nx.DiGraph):
 		pretty plotting of the network graph for one time step
 		'''
 		plt.figure(figsize=figsize)
-		node_color = 'steel_blue'
-		pos = dict( (n, self.position(n, jitter)) for n in self.nodes() )
+		ax = plt.gca()
+		layout = self.get_layout(jitter)
 		if paths is None:
-			nx.draw(self ,pos,with_labels = False, node_size=50)
+			self.draw_layout(ax, layout, node_size=50)
 		else:
-			nx.draw(self ,pos,with_labels = False, node_size=1)
+			self.draw_layout(ax, layout, node_size=1)
 		if paths is not None:
-			for i,node in enumerate(paths):
-				nx.draw_networkx_nodes(self, pos,node_size = 500,nodelist=[node],node_color = COLORS[i])
+			positions = layout[self.get_rows(paths)]
+			ax.scatter(positions[:,0], positions[:,1], s = 500, c = [COLORS[i] for i in range(len(paths))], zorder = 3)
 		if title is not None:
 			plt.savefig(title)
 		plt.show()
@@ -421,9 +445,8 @@ class SuperNode(nx.DiGraph):
 	'''
 	node containing multiple 8 internal nodes representing the switches, but not allowing 180 turn
 
-	the different nodes are ['node.name_N_in','node.name_N_out','node.name_E_in',
-							'node.name_E_out','node.name_W_in','node.name_W_out',
-							'node.name_S_in','node.name_S_out']
+	the different nodes are ['N_in','N_out','E_in','E_out','W_in','W_out','S_in','S_out'], the node of 
+	port p is the int id encode(index[0],index[1],PORT_INDEX[p],width) (see src.graph.node_ids)
 
 
 	Here is a visual representation of the inner working of such a SuperNode
@@ -437,20 +460,26 @@ class SuperNode(nx.DiGraph):
 				South_in	South_out
 	'''
 
-	def __init__(self, index, transitions, nodes = ['N_in','N_out','E_in','E_out',
-													'W_in','W_out','S_in','S_out']):
+	def __init__(self, index, transitions, width, nodes = PORTS):
 
 		super().__init__()
 		self.name = str(index)
 		self.index = index
+		self.width = width
 		self.constraints = []
 		
 		#constant defined if changes in the structure of the incoming matrix
 		self.in_suffix = '_in'
 		self.out_suffix = '_out'
 
-		self.add_nodes_from([self.name +"_"+ x for x in nodes])
+		self.add_nodes_from([self.get_node(x) for x in nodes])
 		self.add_edges_from_transition(transitions)
+
+	def get_node(self,port):
+		'''
+		id of the node port ('N_in',...) of the superNode
+		'''
+		return encode(self.index[0],self.index[1],PORT_INDEX[port],self.width)
 		
 
 	def add_edges_from_transition(self,transitions):
@@ -471,14 +500,14 @@ class SuperNode(nx.DiGraph):
 
 		for in_direction,out_directions in transitions.items():
 			#get the name of the entry node
-			node_base = self.name + "_" + OPPOSITE_DIRECTION[in_direction] + self.in_suffix
+			node_base = self.get_node(OPPOSITE_DIRECTION[in_direction] + self.in_suffix)
 
 			for out_direction in out_directions:
 				#uncomment this line to forbid 180 turn at endpoint
 				#if self.__check_180_turn(in_direction,out_direction):
 				if True:
 					#get the name of the out node
-					node_arrival =self.name + "_" + out_direction + self.out_suffix
+					node_arrival = self.get_node(out_direction + self.out_suffix)
 
 					#add an edge between them
 					self.constraints.append((node_base,node_arrival))
@@ -487,9 +516,9 @@ class SuperNode(nx.DiGraph):
 	def update_node_attribute(self,annotations):
 		for node in self.nodes:
 			for key,item in annotations.items():
-				if item.startswith('source') and node.endswith('out'):
+				if item.startswith('source') and is_out(node):
 					self.node[node][key] = item
-				elif item.startswith("sink") and node.endswith('in'):
+				elif item.startswith("sink") and not is_out(node):
 					self.node[node][key] = item
 				elif item == 'transshipment':
 					self.node[node][key] = item
@@ -525,8 +554,8 @@ class SuperNode(nx.DiGraph):
 		labels = {}
 		#trick to add the proper nodes names
 		for k,elt in JITTER.items():
-			pos[self.name + "_" + k] = elt
-			labels[self.name + "_" + k] = k
+			pos[self.get_node(k)] = elt
+			labels[self.get_node(k)] = k
 
 		options = {
 			'pos':pos,
@@ -1 +1,23 @@
-from .NetworkGraph import NetworkGraph
+import importlib
+import sys
+import types
+
+
+class _GraphPackage(types.ModuleType):
+	'''
+	src.graph with NetworkGraph (networkx, matplotlib) imported on first access, so that importing
+	src.graph.transitions or src.graph.node_ids stays cheap. NetworkGraph is a property so that importing
+	the submodule src.graph.NetworkGraph does not replace the class by the module
+	'''
+	@property
+	def NetworkGraph(self):
+		return importlib.import_module('.NetworkGraph', __name__).NetworkGraph
+
+	@NetworkGraph.setter
+	def NetworkGraph(self, module):
+		pass
+
+
+sys.modules[__name__].__class__ = _GraphPackage
+
+__all__ = ['NetworkGraph']
@@ -0,0 +1,154 @@
+'''
+integer ids of the nodes of the graphs built from a flatland grid
+
+a node of a cell (row, col) of a grid of width W is the int (row * W + col) * 8 + port, with port the index
+of the node in the cell (see PORTS for the 8 nodes of a SuperNode, SIDES for the 2 nodes of a cell in the
+low level graph of the benchmark). In the time expanded network the node of id n at time t is t * stride + n
+with stride = 8 * H * W, so that the ids grow with time. The sources and sinks of the commodities are the
+negative ids (see source and sink).
+
+all the functions work on ints as well as on numpy arrays of ints, the strings (to_str) are only for display
+'''
+import numpy as np
+
+N_PORTS = 8
+
+#nodes of a SuperNode, the in nodes have even ports and the out nodes odd ports
+PORTS = ['N_in','N_out','E_in','E_out','W_in','W_out','S_in','S_out']
+PORT_INDEX = {port : i for i,port in enumerate(PORTS)}
+
+#nodes of a cell in the low level graph of benchmark.create_env
+SIDES = ['a','b']
+SIDE_INDEX = {side : i for i,side in enumerate(SIDES)}
+
+
+def encode(rows, cols, ports, width):
+	'''
+	id of the node port of the cells (rows, cols)
+	'''
+	return (rows * width + cols) * N_PORTS + ports
+
+
+def decode(ids, width):
+	'''
+	inverse of encode
+
+	Returns
+	-------
+	rows, cols, ports
+	'''
+	cells, ports = divmod(ids, N_PORTS)
+	rows, cols = divmod(cells, width)
+	return rows, cols, ports
+
+
+def cell_of(ids):
+	'''
+	row * W + col of the cell of the nodes, two nodes are in the same cell if they have the same cell_of
+	'''
+	return ids // N_PORTS
+
+
+def port_of(ids):
+	return ids % N_PORTS
+
+
+def set_port(ids, ports):
+	'''
+	id of the node port of the cell of ids
+	'''
+	return ids - ids % N_PORTS + ports
+
+
+def is_out(ids):
+	'''
+	True for the out nodes of a SuperNode
+	'''
+	return ids % 2 == 1
+
+
+def cell_index(node, width):
+	'''
+	(row, col) tuple of the cell of a single node
+	'''
+	row, col, _ = decode(int(node), width)
+	return (row, col)
+
+
+def get_stride(shape):
+	'''
+	number of ids of one time step of the time expanded network of a grid of shape (H, W)
+	'''
+	return N_PORTS * shape[0] * shape[1]
+
+
+def at_time(ids, times, stride):
+	'''
+	id in the time expanded network of the nodes ids at time times
+	'''
+	return times * stride + ids
+
+
+def time_of(ids, stride):
+	return ids // stride
+
+
+def static_of(ids, stride):
+	'''
+	id in the original graph of the nodes of the time expanded network
+	'''
+	return ids % stride
+
+
+def source(commodity):
+	return -2 * commodity - 1
+
+
+def sink(commodity):
+	return -2 * commodity - 2
+
+
+def is_source(ids):
+	return (ids < 0) & (ids % 2 == 1)
+
+
+def is_sink(ids):
+	return (ids < 0) & (ids % 2 == 0)
+
+
+def commodity_of(ids):
+	'''
+	commodity of a source or a sink
+	'''
+	return (-ids - 1) // 2
+
+
+def rows_of(sorted_ids, ids):
+	'''
+	rows in the sorted array sorted_ids of ids (array of any shape), raises a KeyError if an id is missing
+	'''
+	ids = np.asarray(ids)
+	rows = np.searchsorted(sorted_ids, ids)
+	#rows == len(sorted_ids) for the ids greater than all the others, clipped to a different id
+	found = sorted_ids.take(rows, mode = 'clip') == ids if len(sorted_ids) > 0 else np.zeros(ids.shape, dtype = bool)
+	if not found.all():
+		raise KeyError(f'node {ids[~found].flat[0]} is not in the graph')
+	return rows
+
+
+def to_str(node, width, stride = None, names = PORTS):
+	'''
+	display name of a single node: '(x, y)_N_in', with '_t3' at the end for the nodes of a time expanded
+	network (if stride is given), and 'source_k', 'sink_k' for the sources and sinks
+	'''
+	node = int(node)
+	if is_source(node):
+		return "source_" + str(commodity_of(node))
+	if is_sink(node):
+		return "sink_" + str(commodity_of(node))
+	suffix = ""
+	if stride is not None:
+		suffix = "_t" + str(time_of(node, stride))
+		node = static_of(node, stride)
+	row, col, port = decode(node, width)
+	return str((row, col)) + "_" + names[port] + suffix
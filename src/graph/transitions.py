@@ -0,0 +1,111 @@
+import numpy as np
+from functools import lru_cache
+
+# GLOBAL VARIBALES
+TRAD_DIRECTION = {
+	0: 'N',
+	1: 'E',
+	2: 'S',
+	3: 'W'
+}
+
+#BITS[direction, new_direction] is the bit of the flatland 16 bits code allowing a train heading towards
+#direction to leave the cell towards new_direction (one group of 4 bits per direction, NESW from the most
+#significant bit)
+BITS = 1 << ((3 - np.arange(4))[:, None] * 4 + (3 - np.arange(4))[None, :])
+
+
+def decode(codes):
+	'''
+	decode flatland transition codes, works on a single code, a row or a whole grid
+
+	Parameters
+	----------
+	codes : int or numpy.ndarray of int
+
+	Returns
+	-------
+	numpy.ndarray of bool of shape codes.shape + (4,4), [..., direction, new_direction] is True if a
+	train heading towards direction can leave the cell towards new_direction
+	'''
+	codes = np.asarray(codes, dtype = np.int64)
+	return (codes[..., None, None] & BITS) != 0
+
+
+def get_endpoints(codes):
+	'''
+	cells where trains can only come from one direction (dead ends), vectorized
+	'''
+	return decode(codes).any(axis = -1).sum(axis = -1) == 1
+
+
+def get_turns(codes):
+	'''
+	cells where a train heading north or south can leave towards east or west, vectorized
+	'''
+	transitions = decode(codes)
+	return transitions[..., [0, 2], :][..., [1, 3]].any(axis = (-1, -2))
+
+
+@lru_cache(maxsize = None)
+def get_new_directions(code, direction):
+	'''
+	tuple of the directions (int) a train heading towards direction can leave the cell code towards
+	'''
+	return tuple(int(x) for x in np.flatnonzero(decode(int(code))[direction]))
+
+
+@lru_cache(maxsize = None)
+def _transition_tuples(code):
+	return tuple((TRAD_DIRECTION[direction], tuple(TRAD_DIRECTION[x] for x in get_new_directions(code, direction)))
+				 for direction in range(4))
+
+
+def transition_dict(code):
+	'''
+	return the possible transitions from the cell described by code, the decoding is cached and a
+	new dict is returned at each call so that it can be modified
+
+	Returns
+	-------
+	dict
+	{
+		'N':['S','E'],
+		'E':[],
+		'S':['N'],
+		'W':['E']
+	}
+	'''
+	return {direction : list(new_directions) for direction, new_directions in _transition_tuples(int(code))}
+
+
+class TransitionTable():
+	'''
+	decoded transitions of a whole grid, computed once for each distinct code of the grid
+
+	codes : numpy.ndarray, the distinct codes
+	inverse : numpy.ndarray of the shape of the grid, index in codes of the code of each cell
+	transitions : (codes, 4, 4) see decode
+	endpoints, turns : (codes,) see get_endpoints and get_turns
+	'''
+
+	def __init__(self, grid):
+		grid = np.asarray(grid, dtype = np.int64)
+		self.shape = grid.shape
+		self.codes, inverse = np.unique(grid, return_inverse = True)
+		self.inverse = inverse.reshape(self.shape)
+		self.transitions = decode(self.codes)
+		self.endpoints = get_endpoints(self.codes)
+		self.turns = get_turns(self.codes)
+
+	def get_transitions(self):
+		'''
+		(height, width, 4, 4) decoded transitions of each cell
+		'''
+		return self.transitions[self.inverse]
+
+	def get_endpoints(self):
+		return self.endpoints[self.inverse]
+
+	def get_turns(self):
+		return self.turns[self.inverse]
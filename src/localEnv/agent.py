@@ -1,51 +1,170 @@
 import numpy as np
 
-
-class AgentStatic():
-    def __init__(self, EnvAgent):
-        self.initial_position = EnvAgent.initial_position
-        self.position = EnvAgent.position
-        self.initial_position = EnvAgent.initial_position
-        self.direction = EnvAgent.direction
-        self.target = EnvAgent.target 
-        self.moving = EnvAgent.moving
-        self.speed_data = EnvAgent.speed_data
-        self.malfunction_data = EnvAgent.malfunction_data
 #                                            READY_TO_DEPART = 0  # not in grid yet (position is None) -> prediction as if it were at initial position
 #                                            ACTIVE = 1  # in grid (position is not None), not done -> prediction is remaining path
 #                                            DONE = 2  # in grid (position is not None), but done -> prediction is stay at target forever
 #                                            DONE_REMOVED = 3  # removed from grid (position is None) -> prediction is None
-        self.status = EnvAgent.status
-        self.position = EnvAgent.position
-        self.handle = EnvAgent.handle
-        self.old_direction = EnvAgent.old_direction
-        self.old_position = EnvAgent.old_position
-        
+DONE = 2
+
+#fields of the agents stored as arrays, restored by AgentStore.restart
+STATE_FIELDS = ('positions', 'directions', 'position_fractions', 'transition_actions',
+                'status', 'moving', 'old_positions', 'old_directions')
+
+
+def position_to_array(position):
+    """
+    None positions (agent not in the grid) are stored as (-1,-1)
+    """
+    return (-1, -1) if position is None else position
+
+def array_to_position(array):
+    if array[0] < 0:
+        return None
+    return (int(array[0]), int(array[1]))
+
+
+class AgentStore():
+    def __init__(self, EnvAgents):
+        """
+        Struct of arrays holding the state of all the agents, copied from the flatland EnvAgents.
+        The initial state is saved once so that restart() only copies a few arrays, nothing is shared
+        with the EnvAgents (in particular not the speed_data dicts).
+        """
+        self.handles = np.array([agent.handle for agent in EnvAgents], dtype=int)
+        self.initial_positions = np.array([position_to_array(agent.initial_position) for agent in EnvAgents], dtype=int).reshape(-1, 2)
+        self.targets = np.array([position_to_array(agent.target) for agent in EnvAgents], dtype=int).reshape(-1, 2)
+        self.speeds = np.array([agent.speed_data['speed'] for agent in EnvAgents], dtype=float)
+
+        self.positions = np.array([position_to_array(agent.position) for agent in EnvAgents], dtype=int).reshape(-1, 2)
+        self.directions = np.array([agent.direction for agent in EnvAgents], dtype=int)
+        self.position_fractions = np.array([agent.speed_data['position_fraction'] for agent in EnvAgents], dtype=float)
+        self.transition_actions = np.array([agent.speed_data['transition_action_on_cellexit'] for agent in EnvAgents], dtype=int)
+        self.status = np.array([agent.status for agent in EnvAgents], dtype=int)
+        self.moving = np.array([agent.moving for agent in EnvAgents], dtype=bool)
+        self.old_positions = np.array([position_to_array(agent.old_position) for agent in EnvAgents], dtype=int).reshape(-1, 2)
+        self.old_directions = np.array([-1 if agent.old_direction is None else agent.old_direction for agent in EnvAgents], dtype=int)
+        self.malfunction_data = [dict(agent.malfunction_data) for agent in EnvAgents]
+
+        self.__snapshot = {field : getattr(self, field).copy() for field in STATE_FIELDS}
+        self.__snapshot_malfunction_data = [dict(data) for data in self.malfunction_data]
+
+    def __len__(self):
+        return len(self.handles)
+
+    def restart(self, handle = None):
+        """
+        Restores the initial state of all the agents, or only of the agent handle if given
+        """
+        index = slice(None) if handle is None else handle
+        for field, values in self.__snapshot.items():
+            getattr(self, field)[index] = values[index]
+
+        if handle is None:
+            self.malfunction_data = [dict(data) for data in self.__snapshot_malfunction_data]
+        else:
+            self.malfunction_data[handle] = dict(self.__snapshot_malfunction_data[handle])
+
+
 class Agent():
-    def __init__(self, EnvAgent):
-        self.agent_static = AgentStatic(EnvAgent)
-        self.initial_position = EnvAgent.initial_position
-        self.position = EnvAgent.position
-        self.initial_position = EnvAgent.initial_position
-        self.direction = EnvAgent.direction
-        self.target = EnvAgent.target 
-        self.moving = EnvAgent.moving
-        self.speed_data = EnvAgent.speed_data
-        self.malfunction_data = EnvAgent.malfunction_data
-#                                            READY_TO_DEPART = 0  # not in grid yet (position is None) -> prediction as if it were at initial position
-#                                            ACTIVE = 1  # in grid (position is not None), not done -> prediction is remaining path
-#                                            DONE = 2  # in grid (position is not None), but done -> prediction is stay at target forever
-#                                            DONE_REMOVED = 3  # removed from grid (position is None) -> prediction is None
-        self.status = EnvAgent.status
-        self.position = EnvAgent.position
-        self.handle = EnvAgent.handle
-        self.old_direction = EnvAgent.old_direction
-        self.old_position = EnvAgent.old_position
-    
-    
+    """
+    View on one agent of an AgentStore, with the same attributes as the flatland EnvAgent
+    (except speed_data which is split into position_fraction, speed and transition_action_on_cellexit).
+    """
+    __slots__ = ('store', 'handle')
+
+    def __init__(self, store, handle):
+        self.store = store
+        self.handle = handle
+
+    def __repr__(self):
+        fields = ('handle', 'position', 'direction', 'target', 'position_fraction', 'speed',
+                  'transition_action_on_cellexit', 'status', 'old_position', 'old_direction')
+        return str({field : getattr(self, field) for field in fields})
+
+    @property
+    def initial_position(self):
+        return array_to_position(self.store.initial_positions[self.handle])
+
+    @property
+    def target(self):
+        return array_to_position(self.store.targets[self.handle])
+
+    @property
+    def speed(self):
+        return float(self.store.speeds[self.handle])
+
+    @property
+    def position(self):
+        return array_to_position(self.store.positions[self.handle])
+
+    @position.setter
+    def position(self, position):
+        self.store.positions[self.handle] = position_to_array(position)
+
+    @property
+    def direction(self):
+        return int(self.store.directions[self.handle])
+
+    @direction.setter
+    def direction(self, direction):
+        self.store.directions[self.handle] = direction
+
+    @property
+    def position_fraction(self):
+        return float(self.store.position_fractions[self.handle])
+
+    @position_fraction.setter
+    def position_fraction(self, position_fraction):
+        self.store.position_fractions[self.handle] = position_fraction
+
+    @property
+    def transition_action_on_cellexit(self):
+        return int(self.store.transition_actions[self.handle])
+
+    @transition_action_on_cellexit.setter
+    def transition_action_on_cellexit(self, action):
+        self.store.transition_actions[self.handle] = action
+
+    @property
+    def status(self):
+        return int(self.store.status[self.handle])
+
+    @status.setter
+    def status(self, status):
+        self.store.status[self.handle] = status
+
+    @property
+    def moving(self):
+        return bool(self.store.moving[self.handle])
+
+    @moving.setter
+    def moving(self, moving):
+        self.store.moving[self.handle] = moving
+
+    @property
+    def old_position(self):
+        return array_to_position(self.store.old_positions[self.handle])
+
+    @old_position.setter
+    def old_position(self, position):
+        self.store.old_positions[self.handle] = position_to_array(position)
+
+    @property
+    def old_direction(self):
+        direction = self.store.old_directions[self.handle]
+        return None if direction < 0 else int(direction)
+
+    @old_direction.setter
+    def old_direction(self, direction):
+        self.store.old_directions[self.handle] = -1 if direction is None else direction
+
+    @property
+    def malfunction_data(self):
+        return self.store.malfunction_data[self.handle]
+
     def set_action(self, action):
-        if self.speed_data['position_fraction'] == 0. :
-            self.speed_data['transition_action_on_cellexit'] = action
-    
+        if self.position_fraction == 0. :
+            self.transition_action_on_cellexit = action
+
     def restart(self):
-        self.__init__(self.agent_static)
\ No newline at end of file
+        self.store.restart(self.handle)
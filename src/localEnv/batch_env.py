@@ -0,0 +1,136 @@
+import numpy as np
+from lookuptable import LookUpTable
+
+
+class BatchLocalEnv():
+    def __init__(self, grid, agents, batch_size):
+        """
+        Keeps batch_size independent copies of the agents of a LocalEnv in numpy arrays and steps all of
+        them at once. The agents move with the compiled arrays of LookUpTable : the action is only read when
+        the agent is at the beginning of a cell, agents are handled in the order of their handles and an agent
+        does not move if its new cell is occupied, as in LocalEnv.step.
+
+        The transitions are the ones of LocalEnv for the valid actions (LookUpTable.valid_actions, action 4
+        is always valid), which are the only ones the learners take (see check_batch_env.py). They differ
+        for the other actions : a non valid action (0, a turn where there is no switch, 1 or 3 on a dead end)
+        keeps the agent in its state here, while LocalEnv applies LookUpTable.get_new_state (0 moves straight
+        on, any action turns back on a dead end, and the agent can leave the rail).
+
+        Arrays of shape (batch_size, number of agents) :
+            state : index of the state (cell, direction) of each agent, see LookUpTable.state_index
+            position_fraction : speed_data['position_fraction'] of each agent
+            transition_action_on_cellexit : speed_data['transition_action_on_cellexit'] of each agent
+            done : True once the agent has reached its target
+            blocked : True when the move of the agent was refused during the last step because its new cell
+                      was occupied (LocalEnv.blocked)
+
+        Parameters
+        ----------
+        grid : numpy.ndarray
+            env.rail.grid
+        agents : list of flatland agents
+        batch_size : int
+        """
+        self.table = LookUpTable(grid, make_arrays=True)
+        self.batch_size = batch_size
+        self.number_agents = len(agents)
+        height, width = self.table.state_index.shape[:2]
+
+        #cell index of each state and transitions for actions 0 to 4, a non valid action keeps the state
+        self.state_cell = self.table.states[:, 0] * width + self.table.states[:, 1]
+        number_states = len(self.table.states)
+        self.transitions = np.tile(np.arange(number_states, dtype=np.int32)[:, None], (1, 5))
+        self.transitions[:, 1:] = np.where(self.table.valid_actions, self.table.next_state, self.transitions[:, 1:])
+
+        initial_state = np.zeros(self.number_agents, dtype=np.int32)
+        for handle, agent in enumerate(agents):
+            position = agent.position if agent.position is not None else agent.initial_position
+            initial_state[handle] = self.table.get_state_index(position, agent.direction)
+            if initial_state[handle] < 0:
+                raise ValueError(f"agent {handle} is in state {position, agent.direction} which is not on the rail")
+
+        self.speed = np.array([agent.speed_data['speed'] for agent in agents], dtype=float)
+        self.target_cell = np.array([agent.target[0] * width + agent.target[1] for agent in agents])
+        self.initial_state = initial_state
+        self.initial_position_fraction = np.array([agent.speed_data['position_fraction'] for agent in agents], dtype=float)
+        self.initial_action = np.array([agent.speed_data['transition_action_on_cellexit'] for agent in agents], dtype=int)
+
+        self.state = np.zeros((batch_size, self.number_agents), dtype=np.int32)
+        self.position_fraction = np.zeros((batch_size, self.number_agents))
+        self.transition_action_on_cellexit = np.zeros((batch_size, self.number_agents), dtype=int)
+        self.done = np.zeros((batch_size, self.number_agents), dtype=bool)
+        self.blocked = np.zeros((batch_size, self.number_agents), dtype=bool)
+        self.restart_agents()
+
+
+    def restart_agents(self, indices = None):
+        """
+        Puts the agents of the copies in indices (all copies if None) back in their initial state
+        """
+        if indices is None:
+            indices = slice(None)
+        self.state[indices] = self.initial_state
+        self.position_fraction[indices] = self.initial_position_fraction
+        self.transition_action_on_cellexit[indices] = self.initial_action
+        self.done[indices] = self.get_cells()[indices] == self.target_cell
+        self.blocked[indices] = False
+
+
+    def get_cells(self):
+        """
+        Returns the (batch_size, number of agents) array of the cell index (x * width + y) of each agent
+        """
+        return self.state_cell[self.state]
+
+
+    def get_valid_actions(self):
+        """
+        Returns the (batch_size, number of agents, 4) mask of the valid actions 1 to 4 of each agent
+        """
+        return self.table.valid_actions[self.state]
+
+
+    def step(self, actions):
+        """
+        Steps all the copies at once.
+
+        Parameters
+        ----------
+        actions : array of int of shape (batch_size, number of agents), actions 1 to 4 of LookUpTable.
+
+        Returns
+        -------
+        rewards : (batch_size,) minus the number of agents which are not at their target
+        state : (batch_size, number of agents) new states
+        done : (batch_size, number of agents) agents which have reached their target
+        """
+        actions = np.asarray(actions)
+        cells = self.get_cells()
+
+        for handle in range(self.number_agents):
+            state = self.state[:, handle]
+            fraction = self.position_fraction[:, handle]
+
+            #the action is only taken into account at the beginning of a cell
+            at_cell_start = fraction == 0.
+            self.transition_action_on_cellexit[at_cell_start, handle] = actions[at_cell_start, handle]
+            action = self.transition_action_on_cellexit[:, handle]
+
+            stop = at_cell_start & (action == 4)
+            leave_cell = ~stop & (fraction + self.speed[handle] >= 1)
+            valid_action = (action >= 0) & (action <= 4)
+            new_state = np.where(leave_cell & valid_action, self.transitions[state, np.clip(action, 0, 4)], state)
+            new_fraction = np.where(stop | leave_cell, 0., fraction + self.speed[handle])
+
+            new_cell = self.state_cell[new_state]
+            occupied = ((cells == new_cell[:, None]) & (np.arange(self.number_agents) != handle)).any(axis=1)
+
+            self.blocked[:, handle] = occupied
+            self.state[:, handle] = np.where(occupied, state, new_state)
+            self.position_fraction[:, handle] = new_fraction
+            cells[:, handle] = self.state_cell[self.state[:, handle]]
+
+        at_target = cells == self.target_cell
+        self.done |= at_target
+        rewards = -(~at_target).sum(axis=1)
+        return rewards, self.state.copy(), self.done.copy()
@@ -0,0 +1,66 @@
+from env import LocalEnv
+from batch_env import BatchLocalEnv
+from agent import DONE
+from random_stream import RandomStream
+from check_qtable import GRID
+import numpy as np
+
+
+class ScriptedAgent(): #the fields of a flatland EnvAgent read by LocalEnv and BatchLocalEnv
+    def __init__(self, handle, position, direction, target, speed):
+        self.handle = handle
+        self.initial_position = position
+        self.position = position
+        self.direction = direction
+        self.target = target
+        self.speed_data = {'speed' : speed, 'position_fraction' : 0., 'transition_action_on_cellexit' : 0}
+        self.malfunction_data = {'malfunction' : 0}
+        self.status = 1
+        self.moving = False
+        self.old_position = None
+        self.old_direction = None
+
+
+def check_steps(agents, batch_size, n_steps, stop_probability = .1, seed = 0):
+    """
+    steps batch_size LocalEnv and one BatchLocalEnv with batch_size copies with the same random valid actions
+    (see LookUpTable.valid_actions, action 4 with probability stop_probability) and checks that the agents
+    have the same states, position fractions, blocked and done flags after each step. The copies where all
+    the agents are done are restarted in both.
+    """
+    stream = RandomStream(seed)
+    envs = [LocalEnv(GRID, agents) for copy in range(batch_size)]
+    batch_env = BatchLocalEnv(GRID, agents, batch_size)
+    table = batch_env.table
+
+    for step in range(n_steps):
+        valid = batch_env.get_valid_actions()
+        draws = stream.random_array(valid.shape[:2])
+        cumulative = valid[..., :3].cumsum(axis=-1)
+        #uniform among the valid actions 1 to 3, action 4 if there is none or with probability stop_probability
+        actions = (cumulative > (draws * cumulative[..., -1]).astype(int)[..., None]).argmax(axis=-1) + 1
+        actions[(cumulative[..., -1] == 0) | (stream.random_array(draws.shape) < stop_probability)] = 4
+
+        batch_env.step(actions)
+        for copy, env in enumerate(envs):
+            env.step(dict(enumerate(actions[copy].tolist())))
+            states = [table.get_state_index(agent.position, agent.direction) for agent in env.agents]
+            assert np.array_equal(states, batch_env.state[copy]), (step, copy, states, batch_env.state[copy])
+            assert np.array_equal(env.agents_store.position_fractions, batch_env.position_fraction[copy]), (step, copy)
+            assert np.isin(np.arange(len(agents)), env.blocked).tolist() == batch_env.blocked[copy].tolist(), (step, copy)
+            assert np.array_equal(env.agents_store.status == DONE, batch_env.done[copy]), (step, copy)
+
+        finished = np.flatnonzero(batch_env.done.all(axis=1))
+        batch_env.restart_agents(finished)
+        for copy in finished:
+            envs[copy].restart_agents()
+    return int(batch_env.blocked.sum())
+
+
+if __name__ == "__main__":
+    agents = [ScriptedAgent(0, (2,1), 0, (0,0), 1.),
+              ScriptedAgent(1, (1,2), 2, (4,1), 1.),
+              ScriptedAgent(2, (3,1), 0, (0,2), .5)]
+    for n_agents in (1, 2, 3):
+        check_steps(agents[:n_agents], 16, 2000)
+        print(n_agents, 'agents: same states, position fractions, blocked and done flags')
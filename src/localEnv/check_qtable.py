@@ -0,0 +1,95 @@
+from lookuptable import LookUpTable
+from qtable import QTable
+from random_stream import RandomStream
+from itertools import product
+import numpy as np
+
+#a small grid with a loop, a switch and two dead ends
+GRID = np.array([[ 8192,     0,  8192,     0,     0],
+                 [   72, 20994,  2064,     0,     0],
+                 [    0, 32872,  4608,     0,     0],
+                 [    0, 32800,   128,     0,     0],
+                 [    0,   128,     0,     0,     0]])
+
+
+class DictQTable(): #the double Q table of dicts replaced by QTable, used as a reference
+    def __init__(self, n_agents, initial_state, initial_value, gamma, lr, stream):
+        self.gamma = gamma
+        self.learning_rate = lr
+        self.initial_value = initial_value
+        self.stream = stream
+        self.table = {}
+        self.table_1 = {}
+        self.table_2 = {}
+        self.actions = [1,2,3,4] if n_agents == 1 else list(product(*[[1,2,3,4]]*n_agents))
+        self.add_state(initial_state)
+
+    def add_state(self, state):
+        self.table[state] = dict.fromkeys(self.actions, self.initial_value)
+        self.table_1[state] = dict.fromkeys(self.actions, self.initial_value)
+        self.table_2[state] = dict.fromkeys(self.actions, self.initial_value)
+
+    def update_table(self, state, action, state_, reward):
+        choice = self.stream.coin()
+        if state_ not in self.table:
+            self.add_state(state_)
+            next_value = self.initial_value
+        elif choice == 1:
+            next_value = self.table_2[state_][max(self.table_1[state_], key = self.table_1[state_].get)]
+        else:
+            next_value = self.table_1[state_][max(self.table_2[state_], key = self.table_2[state_].get)]
+
+        updated = self.table_1 if choice == 1 else self.table_2
+        updated[state][action] += self.learning_rate * (reward + self.gamma * next_value - updated[state][action])
+        for action in self.actions:
+            self.table[state][action] = .5*(self.table_1[state][action] + self.table_2[state][action])
+
+    def get_max_action(self, state):
+        return max(self.table[state], key = self.table[state].get)
+
+
+def check_actions(n_agents):
+    """
+    encode_action and decode_action are inverse and the columns are in the order of QTable.actions
+    """
+    qtable = QTable(n_agents, 0, 0, .9, .8)
+    for column, action in enumerate(qtable.actions):
+        assert qtable.encode_action(action) == column
+        assert qtable.decode_action(column) == action
+
+
+def check_updates(n_agents, n_updates, seed = 0):
+    """
+    QTable and DictQTable give the same values and greedy actions for the same updates, along random walks
+    of the agents on GRID (the states are the tuples of the states of the agents in the LookUpTable)
+    """
+    lookup = LookUpTable(GRID, make_arrays=True)
+    walk = RandomStream(seed)
+    states = np.array([walk.integer(len(lookup.states)) for agent in range(n_agents)])
+    initial_state = tuple(states.tolist())
+    qtable = QTable(n_agents, initial_state, 0., .9, .8, capacity = 1, stream = RandomStream(seed + 1))
+    reference = DictQTable(n_agents, initial_state, 0., .9, .8, RandomStream(seed + 1))
+
+    for update in range(n_updates):
+        state = tuple(states.tolist())
+        action = reference.actions[walk.integer(len(reference.actions))]
+        moves = np.reshape(action, n_agents)
+        new_states = lookup.next_state[states, moves - 1]
+        states = np.where(new_states >= 0, new_states, states)
+        reward = -walk.random()
+        qtable.update_table(state, action, tuple(states.tolist()), reward)
+        reference.update_table(state, action, tuple(states.tolist()), reward)
+
+    assert list(qtable.index) == list(reference.table)
+    for state, row in qtable.index.items():
+        for name in ('table', 'table_1', 'table_2'):
+            values = [getattr(reference, name)[state][action] for action in qtable.actions]
+            assert np.array_equal(getattr(qtable, name)[row], values), (state, name)
+        assert qtable.get_max_action(state) == reference.get_max_action(state), state
+    return len(qtable.index)
+
+
+if __name__ == "__main__":
+    for n_agents in (1, 2, 3):
+        check_actions(n_agents)
+        print(n_agents, 'agents:', check_updates(n_agents, 20000), 'states, same values and greedy actions')
@@ -0,0 +1,171 @@
+import numpy as np
+import json
+import os
+
+
+META = 'meta.json'
+KEYS = 'keys'
+
+
+def flatten_key(key):
+    """
+    returns the list of the ints of a state key (nested tuples of ints)
+    """
+    if isinstance(key, (tuple, list)):
+        return [value for item in key for value in flatten_key(item)]
+    return [int(key)]
+
+
+def key_structure(key):
+    """
+    returns the nesting of a state key as nested lists of None, e.g. [[None, None], None] for ((x, y), direction)
+    """
+    if isinstance(key, (tuple, list)):
+        return [key_structure(item) for item in key]
+    return None
+
+
+def unflatten_key(values, structure):
+    """
+    inverse of flatten_key for keys with the given key_structure
+    """
+    values = iter(values)
+
+    def build(structure):
+        if structure is None:
+            return int(next(values))
+        return tuple(build(item) for item in structure)
+
+    return build(structure)
+
+
+class Checkpoint():
+    def __init__(self, directory):
+        """
+        Rows of a table stored in a directory as raw binary files (C order, one per array) with a json file
+        meta.json giving the number of rows, the generation of the arrays, the dtype and number of columns of
+        each array and the structure of the state keys. The keys are stored flattened as an int64 array (see
+        flatten_key).
+
+        The files a reader (see open) maps are never modified: the keys only grow, so save appends the new
+        keys after the saved ones, and the values of the rows change, so each save writes the arrays to the
+        files of a new generation (name.generation.bin). The meta file is atomically replaced once the files
+        are on disk, a save interrupted before leaves the previous generation readable. The files of the
+        generations before the previous one are deleted (the readers which mapped them keep their data).
+        open maps the files with np.memmap, nothing is read before it is used (with mode 'c' the maps are
+        copy on write : the arrays can be modified in memory without changing the files).
+        """
+        self.directory = directory
+
+    def __path(self, name, generation = None):
+        if generation is None:
+            return os.path.join(self.directory, name + '.bin')
+        return os.path.join(self.directory, name + '.' + str(generation) + '.bin')
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.directory, META))
+
+    def read_meta(self):
+        with open(os.path.join(self.directory, META)) as file:
+            return json.load(file)
+
+    def __write(self, path, data, offset = 0):
+        """
+        writes data at offset in the file (created if needed), drops what follows and syncs the file
+        """
+        with open(path, 'r+b' if offset > 0 else 'wb') as file:
+            file.seek(offset)
+            file.write(data)
+            file.truncate()
+            file.flush()
+            os.fsync(file.fileno())
+
+    def __remove_generations(self, names, generation):
+        """
+        deletes the files of the generations before generation
+        """
+        for name in names:
+            prefix = name + '.'
+            for file_name in os.listdir(self.directory):
+                old = file_name[len(prefix):-len('.bin')]
+                if file_name.startswith(prefix) and file_name.endswith('.bin') and old.isdigit() \
+                   and int(old) < generation:
+                    try:
+                        os.remove(os.path.join(self.directory, file_name))
+                    except OSError: #still mapped on systems which do not allow it
+                        pass
+
+    def save(self, arrays, keys = None):
+        """
+        Parameters
+        ----------
+        arrays : dict name -> 2d array, the used rows of the tables (same number of rows)
+        keys : list of the state keys of the rows in order, None if the rows are not indexed by keys
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        n_rows = len(next(iter(arrays.values())))
+        meta = {'n_rows' : n_rows,
+                'generation' : 0,
+                'arrays' : {name : {'dtype' : str(array.dtype), 'n_columns' : array.shape[1]}
+                            for name, array in arrays.items()}}
+        if keys is not None and n_rows > 0:
+            meta['key_structure'] = key_structure(keys[0])
+            meta['key_width'] = len(flatten_key(keys[0]))
+
+        n_saved = 0
+        if self.exists():
+            old_meta = self.read_meta()
+            if old_meta['arrays'] != meta['arrays']:
+                raise ValueError(f"{self.directory} holds arrays {old_meta['arrays']}, not {meta['arrays']}")
+            n_saved = old_meta['n_rows']
+            if n_rows < n_saved:
+                raise ValueError(f"{self.directory} holds {n_saved} rows, the tables can only grow")
+            meta['generation'] = old_meta['generation'] + 1
+
+        for name, array in arrays.items():
+            self.__write(self.__path(name, meta['generation']), np.ascontiguousarray(array).tobytes())
+
+        if 'key_width' in meta:
+            #the saved keys are kept, only what an interrupted save could have appended after them is replaced
+            new_keys = np.array([flatten_key(key) for key in keys[n_saved:]], dtype=np.int64).reshape(-1, meta['key_width'])
+            self.__write(self.__path(KEYS), new_keys.tobytes(), n_saved * new_keys.shape[1] * 8)
+
+        with open(os.path.join(self.directory, META + '.tmp'), 'w') as file:
+            json.dump(meta, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(os.path.join(self.directory, META + '.tmp'), os.path.join(self.directory, META))
+        self.__remove_generations(meta['arrays'], meta['generation'] - 1)
+
+    def open(self, mode = 'r'):
+        """
+        Parameters
+        ----------
+        mode : str, mode of np.memmap, 'r' or 'c' (the files of a checkpoint are never written once saved)
+
+        Returns
+        -------
+        dict name -> np.memmap of shape (n_rows, n_columns) of the arrays, with the keys under 'keys'
+        (flattened, of shape (n_rows, length of a key)) if the rows are indexed by keys
+        """
+        if mode not in ('r', 'c'):
+            raise ValueError(f"mode should be 'r' or 'c', not {mode}")
+        meta = self.read_meta()
+        n_rows = meta['n_rows']
+        arrays = {}
+        for name, info in meta['arrays'].items():
+            arrays[name] = np.memmap(self.__path(name, meta['generation']), dtype=info['dtype'], mode=mode,
+                                     shape=(n_rows, info['n_columns'])) if n_rows > 0 \
+                           else np.zeros((0, info['n_columns']), dtype=info['dtype'])
+        if 'key_width' in meta:
+            arrays[KEYS] = np.memmap(self.__path(KEYS), dtype=np.int64, mode='r', shape=(n_rows, meta['key_width']))
+        return arrays
+
+    def load_keys(self):
+        """
+        returns the list of the state keys of the rows, empty if the rows are not indexed by keys
+        """
+        meta = self.read_meta()
+        if 'key_width' not in meta:
+            return []
+        return [unflatten_key(values, meta['key_structure']) for values in self.open()[KEYS].tolist()]
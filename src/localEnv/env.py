@@ -1,13 +1,16 @@
 from lookuptable import LookUpTable
-from agent import Agent
+from agent import Agent, AgentStore, DONE
 from visualization.graphic import draw_square
 
 
 class LocalEnv():
     def __init__(self, grid, agents):
         self.table = LookUpTable(grid, make_table=True)
-        self.agents = [Agent(agent) for agent in agents]
+        self.agents_store = AgentStore(agents)
+        self.agents = [Agent(self.agents_store, handle) for handle in range(len(agents))]
         self.positions = [ agent.position for agent in self.agents ]
+        #handles of the agents which could not move during the last step because their new cell was occupied
+        self.blocked = []
     
     def render(self, env_renderer):
     
@@ -26,45 +29,48 @@ class LocalEnv():
         """
         Returns new agent state as if it were the only agent on the grid
         """
-        if agent.speed_data['position_fraction'] == 0. and action == 4 :
+        if agent.position_fraction == 0. and action == 4 :
             return agent.position, agent.direction, 0. 
         else:
-            if agent.speed_data['speed'] + agent.speed_data['position_fraction'] >=1:
+            if agent.speed + agent.position_fraction >=1:
                 new_position, new_direction = self.table.get_new_state(agent.position, agent.direction, action)
                 return new_position, new_direction, 0.
             else:
-                return agent.position, agent.direction, agent.speed_data['position_fraction'] + agent.speed_data['speed']
+                return agent.position, agent.direction, agent.position_fraction + agent.speed
             
     
     def show_agents(self):
         for agent in self.agents:
-            print(vars(agent))
+            print(agent)
     
     def restart_agents(self):
-        for agent in self.agents:
-            agent.restart()
+        self.agents_store.restart()
+        self.positions = [ agent.position for agent in self.agents ]
+        self.blocked = []
     
     def step(self, action_dict):
         
 #        for handle, action in action_dict.items():
+        self.blocked = []
             
         for handle, agent in enumerate(self.agents):
             
             if handle in action_dict.keys():
                 agent.set_action(action_dict[handle])
 
-            action = agent.speed_data['transition_action_on_cellexit']
+            action = agent.transition_action_on_cellexit
             new_position, new_direction, new_position_fraction = self.__get_agent_new_state(agent, action)
             
             if new_position in self.positions[:handle] or new_position in self.positions[handle + 1:]:
-                agent.speed_data['position_fraction'] = new_position_fraction
+                agent.position_fraction = new_position_fraction
+                self.blocked.append(handle)
                 agent.old_position, agent.old_direction = agent.position, agent.direction
             else:
                 agent.old_position, agent.old_direction = agent.position, agent.direction
-                agent.position, agent.direction, agent.speed_data['position_fraction'] = new_position, new_direction, new_position_fraction
+                agent.position, agent.direction, agent.position_fraction = new_position, new_direction, new_position_fraction
             
             if agent.position == agent.target:
-                agent.status = 'DONE'
+                agent.status = DONE
             
             self.positions[handle] = agent.position
             
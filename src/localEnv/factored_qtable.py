@@ -0,0 +1,145 @@
+import numpy as np
+from random_stream import RandomStream, select_actions
+from checkpoint import Checkpoint
+
+
+class FactoredQTable(): #for double Q learning with one table per agent
+    def __init__(self, table, n_agents, initial_value, gamma, lr, conflict_penalty = 1., stream = None):
+        """
+        Independent double Q tables, one per agent, over the compiled states of a LookUpTable built with
+        make_arrays=True. The tables have shape (n_agents, states, 4) for the actions 1 to 4, so the memory
+        grows linearly with the number of agents instead of 4**agents * states**agents for QTable.
+        Non valid actions (see LookUpTable.valid_actions) are never chosen.
+
+        The agents are only coupled through their rewards : -1 per step until the agent is at its target
+        and -conflict_penalty when LocalEnv refused its move because the new cell was occupied.
+        The random draws come from stream (a new unseeded RandomStream if None).
+        """
+        self.lookup = table
+        self.gamma = gamma
+        self.learning_rate = lr
+        self.conflict_penalty = conflict_penalty
+        self.stream = stream if stream is not None else RandomStream()
+        self.n_agents = n_agents
+        self.agents = np.arange(n_agents)
+
+        shape = (n_agents, len(table.states), 4)
+        self.table = np.full(shape, float(initial_value))
+        self.table_1 = np.full(shape, float(initial_value))
+        self.table_2 = np.full(shape, float(initial_value))
+
+
+    def get_states(self, agents):
+        """
+        returns the array of the state index of each agent (see LookUpTable.state_index)
+        """
+        return np.array([self.lookup.get_state_index(agent.position, agent.direction) for agent in agents])
+
+
+    def get_rewards(self, done, blocked):
+        """
+        Parameters
+        ----------
+        done : array of bool, agents at their target
+        blocked : list of the handles of the agents whose move was refused by LocalEnv.step
+        """
+        rewards = -(~np.asarray(done)).astype(float)
+        rewards[list(blocked)] -= self.conflict_penalty
+        return rewards
+
+
+    def __masked_argmax(self, table, states, agents = None):
+        if agents is None:
+            agents = self.agents
+        values = np.where(self.lookup.valid_actions[states], table[agents, states], -np.inf)
+        return values.argmax(axis=-1)
+
+
+    def get_max_action(self, states):
+        """
+        returns the array of the greedy action (1 to 4) of each agent
+        """
+        return self.__masked_argmax(self.table, states) + 1
+
+
+    def select_actions(self, states, epsilon):
+        """
+        returns the array of the action (1 to 4) of each agent, epsilon greedy among the valid actions
+        (see random_stream.select_actions)
+        """
+        return select_actions(self.table[self.agents, states], self.lookup.valid_actions[states], epsilon, self.stream) + 1
+
+
+    def update_table(self, states, actions, states_, rewards, done, learning = None):
+        """
+        Double Q update of the tables of all the agents at once.
+
+        Parameters
+        ----------
+        states, actions, states_, rewards : arrays of length n_agents
+        done : array of bool, the transition of the agent is terminal (no value after states_)
+        learning : array of bool, agents to update, all of them if None
+        """
+        if learning is None:
+            learning = np.ones(self.n_agents, dtype=bool)
+        self.update_batch(*(np.asarray(x)[None] for x in (states, actions, states_, rewards, done, learning)))
+
+
+    def save(self, directory):
+        """
+        saves the tables in directory (see checkpoint.Checkpoint), as (agents * states, 4) arrays
+        """
+        Checkpoint(directory).save({name : getattr(self, name).reshape(-1, 4) for name in ('table', 'table_1', 'table_2')})
+
+
+    def load(self, directory):
+        """
+        replaces the tables by the ones saved in directory, which must be for the same grid and number of
+        agents. The tables are copy on write maps of the files (see checkpoint.Checkpoint.open): the rows are
+        read when they are used and the updates stay in memory (the files only change with save)
+        """
+        arrays = Checkpoint(directory).open(mode='c')
+        for name in ('table', 'table_1', 'table_2'):
+            if arrays[name].size != getattr(self, name).size:
+                raise ValueError(f"{directory} holds tables of {arrays[name].shape[0]} rows, not {self.n_agents * len(self.lookup.states)}")
+        for name in ('table', 'table_1', 'table_2'):
+            setattr(self, name, arrays[name].reshape(getattr(self, name).shape))
+
+
+    def __update_entries(self, table, agents, states, columns, target):
+        """
+        table[agents, states, columns] += learning_rate * (target - table[agents, states, columns]), the
+        targets of the transitions which update the same entry are averaged
+        """
+        entries, inverse = np.unique(np.ravel_multi_index((agents, states, columns), table.shape), return_inverse=True)
+        mean_target = np.bincount(inverse, target) / np.bincount(inverse)
+        values = table.reshape(-1)
+        values[entries] += self.learning_rate * (mean_target - values[entries])
+        return entries
+
+
+    def update_batch(self, states, actions, states_, rewards, done, learning):
+        """
+        Double Q update of the tables with a batch of transitions in bulk, the arguments are arrays of shape
+        (steps, n_agents) (see parallel.actor). The targets of all the transitions are computed with the
+        tables before the batch, and the transitions which update the same entry are averaged, so that the
+        batch is applied as one update of each entry it visits. A batch of one step is update_table.
+        """
+        states, states_ = np.asarray(states), np.asarray(states_)
+        agents = np.broadcast_to(self.agents, states.shape)
+        columns = np.asarray(actions) - 1
+        choice_1 = self.stream.random_array(states.shape) < .5
+
+        next_value = np.where(choice_1,
+                              self.table_2[agents, states_, self.__masked_argmax(self.table_1, states_, agents)],
+                              self.table_1[agents, states_, self.__masked_argmax(self.table_2, states_, agents)])
+        next_value[np.asarray(done)] = 0.
+        target = np.asarray(rewards) + self.gamma * next_value
+
+        learning = np.asarray(learning)
+        entries = []
+        for table, update in ((self.table_1, choice_1 & learning), (self.table_2, ~choice_1 & learning)):
+            entries.append(self.__update_entries(table, agents[update], states[update], columns[update], target[update]))
+
+        entries = np.concatenate(entries)
+        self.table.reshape(-1)[entries] = .5*(self.table_1.reshape(-1)[entries] + self.table_2.reshape(-1)[entries])
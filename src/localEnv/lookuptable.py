@@ -1,4 +1,5 @@
 import numpy as np
+from src.graph.transitions import decode, get_new_directions, TransitionTable
 
 # GLOBAL VARIBALES
 
@@ -11,8 +12,13 @@ COORDINATE_OFFSET = {
 
 
 
+#action taken to go from direction d to new direction nd, indexed by (d - nd) % 4
+DIRECTION_CHANGE_ACTION = np.array([2, 1, 2, 3])
+
+
+
 class LookUpTable():
-    def __init__(self, grid, make_table = False):
+    def __init__(self, grid, make_table = False, make_arrays = False):
         '''
         dico has cell coordinate as key and first coordinate of table as item.
         table is (cell) * 4 * 4 *  --- ((x,y) * direction * action).
@@ -24,12 +30,108 @@ class LookUpTable():
             '4' : stop
         We get rid of the action '0' of flatland, but keep the other actions and corresponding numbers 
         for consistency.
+        
+        If make_arrays, the table is also compiled into arrays (see __make_arrays) :
+            state_index : (height, width, 4) index of the state (cell, direction), -1 if no train can be there
+            states : (states, 3) row, column and direction of each state
+            next_state : (states, 4) index of the new state for actions 1 to 4, -1 if the action is not valid
+            valid_actions : (states, 4) mask of the valid actions
         '''
         self.transition_matrix = grid
         self.number_rail_cell = len(self.transition_matrix.nonzero()[0])
 #        self.dico = dict(zip([(self.transition_matrix.nonzero()[0][k], self.transition_matrix.nonzero()[1][k]) for k in range(self.number_rail_cell)], range(self.number_rail_cell)))
         if make_table:
             self.table = self.__make_table()
+        if make_arrays:
+            self.state_index, self.states, self.next_state, self.valid_actions = self.__make_arrays()
+    
+    
+    def __make_arrays(self):
+        """
+        Compiles the table into arrays, with bit operations over the whole grid at once. 
+        The transitions are the same as the ones of __make_table, except for action '4' which always 
+        keeps the agent in its state (get_new_state makes the agent turn back on endpoints).
+        """
+        decoded = TransitionTable(self.transition_matrix)
+        height, width = decoded.shape
+        directions = np.arange(4)
+        
+        #transitions[x, y, direction, new_direction] is True if the transition is allowed
+        transitions = decoded.get_transitions()
+        number_new_directions = transitions.sum(axis=3)
+        endpoints = decoded.get_endpoints()
+        
+        #index the states, in the same order as the keys of __make_table
+        exists = number_new_directions > 0
+        state_index = np.full((height, width, 4), -1, dtype=np.int32)
+        state_index[exists] = np.arange(exists.sum(), dtype=np.int32)
+        states = np.argwhere(exists).astype(np.int32)
+        rows, columns, state_directions = states[:, 0], states[:, 1], states[:, 2]
+        
+        state_transitions = transitions[rows, columns, state_directions]
+        single_direction = number_new_directions[rows, columns, state_directions] == 1
+        is_endpoint = endpoints[rows, columns]
+        offsets = np.array([COORDINATE_OFFSET[direction] for direction in range(4)])
+        
+        next_state = np.full((len(states), 4), -1, dtype=np.int32)
+        valid_actions = np.zeros((len(states), 4), dtype=bool)
+        
+        changes = DIRECTION_CHANGE_ACTION[(state_directions[:, None] - directions[None, :]) % 4]
+        for action in (1, 2, 3):
+            valid = (state_transitions & (changes == action)).any(axis=1)
+            valid = np.where(single_direction, action == 2, valid)
+            
+            if action == 2:
+                new_directions = np.where(single_direction, state_transitions.argmax(axis=1), state_directions)
+            else:
+                new_directions = (state_directions - action) % 4
+            new_directions = np.where(is_endpoint, (state_directions + 2) % 4, new_directions)
+            
+            new_rows = rows + offsets[new_directions, 0]
+            new_columns = columns + offsets[new_directions, 1]
+            inside = (new_rows >= 0) & (new_rows < height) & (new_columns >= 0) & (new_columns < width)
+            
+            targets = np.full(len(states), -1, dtype=np.int32)
+            targets[inside] = state_index[new_rows[inside], new_columns[inside], new_directions[inside]]
+            valid &= targets >= 0
+            next_state[:, action - 1] = np.where(valid, targets, -1)
+            valid_actions[:, action - 1] = valid
+        
+        next_state[:, 3] = np.arange(len(states))
+        valid_actions[:, 3] = True
+        
+        return state_index, states, next_state, valid_actions
+    
+    
+    def get_state_index(self, position, direction):
+        """
+        returns the index of the state (position, direction) in the compiled arrays, -1 if it does not exist
+        """
+        return self.state_index[position[0], position[1], direction]
+    
+    
+    def get_state(self, index):
+        """
+        returns the position tuple and direction of the state index in the compiled arrays
+        """
+        row, column, direction = self.states[index]
+        return (row, column), direction
+    
+    
+    def get_next_states(self, state_indices, actions):
+        """
+        Vectorized version of get_new_state on the compiled arrays.
+        
+        Parameters
+        ----------
+        state_indices : array of int
+        actions : array of int in range(1,5), same shape as state_indices
+        
+        Returns
+        -------
+        array of int : new state indices, -1 where the action is not valid
+        """
+        return self.next_state[state_indices, np.asarray(actions) - 1]
        
         
     def __make_table(self):
@@ -96,15 +198,9 @@ class LookUpTable():
         or list of possible directions length, with value corresponding to the new directions.
         """
         if bool_result:
-            result = list(format(cell_transition >> ((3 - direction) * 4) & 0xF, '04b'))
-            return [int(x) for x in result]
+            return [int(x) for x in decode(cell_transition)[direction]]
         else:
-            result = []
-            new_directions = format(cell_transition >> ((3 - direction) * 4) & 0xF, '04b')
-            for index, char in enumerate(new_directions):
-                if char ==  '1':
-                    result.append(index)
-            return result
+            return list(get_new_directions(cell_transition, direction))
         
     
     def get_directions(self, position, direction, bool_result = True):
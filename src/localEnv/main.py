@@ -1,7 +1,14 @@
 from lookuptable import LookUpTable
 from agent import Agent
 from qtable import QTable
+from factored_qtable import FactoredQTable
 from env import LocalEnv
+from batch_env import BatchLocalEnv
+from agent import DONE
+from random_stream import RandomStream
+from model import JointModel
+from planning import PrioritizedSweeping
+from value_iteration import ExactSolver
 from flatland.envs.observations import TreeObsForRailEnv
 from flatland.envs.rail_env import RailEnv
 from flatland.envs.rail_generators import complex_rail_generator
@@ -9,6 +16,7 @@ from flatland.envs.schedule_generators import complex_schedule_generator
 from flatland.utils.rendertools import RenderTool
 from visualization.graphic import draw_square
 from datetime import datetime
+from functools import reduce
 
 
 import matplotlib.pyplot as plt
@@ -20,10 +28,30 @@ def moving_average(a, n=3) :
     return ret[n - 1:] / n
 
 
-def choose_at_random(epsilon):
-    decision = [0, 1]
-    proba = [1-epsilon, epsilon]
-    return np.random.choice(decision, p=proba)
+def get_joint_state(agents):
+    """
+    returns the state of the joint QTable : the tuple of the (position, direction) of the agents
+    """
+    return tuple((agent.position, agent.direction) for agent in agents)
+
+
+def get_valid_actions(lookup, agents, done):
+    """
+    returns the (agents, 4) mask of the valid actions of the agents (see LookUpTable.valid_actions), only
+    action 4 (stop) for the agents which are done
+    """
+    valid = lookup.valid_actions[[lookup.get_state_index(agent.position, agent.direction) for agent in agents]]
+    valid[done] = (False, False, False, True)
+    return valid
+
+
+def get_joint_mask(valid):
+    """
+    returns the mask of the valid joint actions in the order of the columns of QTable (action of agent 0 as
+    most significant digit) from the (agents, 4) mask of get_valid_actions
+    """
+    return reduce(np.multiply.outer, valid).ravel()
+
 
 def run(env,
         n_episodes,
@@ -31,15 +59,26 @@ def run(env,
         initial_value = 0,
         learning_rate = 0.8,
         gamma = 0.9,
-        epsilon = 0.1):
-    
+        epsilon = 0.1,
+        conflict_penalty = 1.,
+        seed = None):
+    """
+    Double Q learning of the joint action of the agents (see QTable) on a LocalEnv, the state is given by
+    get_joint_state. With probability epsilon each agent takes a random valid action (see
+    LookUpTable.valid_actions), agents which have reached their target stop (action 4). The reward is -1 per
+    agent not at its target and -conflict_penalty per agent whose move was refused by LocalEnv.step, as the
+    sum of the rewards of run_factored. The greedy joint action and the value of the next state are taken
+    among the valid joint actions (see get_joint_mask).
+    All the random draws come from a RandomStream seeded with seed.
+    """
     env.reset()
     number_agents = len(env.agents)
     env.step(dict(zip(range(number_agents),[2]*number_agents)))
     
     my_env = LocalEnv(env.rail.grid, env.agents)
-    initial_state = my_env.initial_state
-    qtable = QTable(number_agents, initial_state, initial_value, gamma, learning_rate )
+    lookup = LookUpTable(env.rail.grid, make_arrays=True)
+    stream = RandomStream(seed)
+    qtable = QTable(number_agents, get_joint_state(my_env.agents), initial_value, gamma, learning_rate, stream = stream)
     
     lap_time = datetime.now()
 
@@ -47,9 +86,10 @@ def run(env,
     
     for episode in range(n_episodes):
         
-        np.random.seed()
         my_env.restart_agents()
-        current_state = my_env.get_current_state()
+        current_state = get_joint_state(my_env.agents)
+        done = my_env.agents_store.status == DONE
+        valid = get_valid_actions(lookup, my_env.agents, done)
         
         if episode % 100 == 0:
             print('episode:', episode)
@@ -59,81 +99,244 @@ def run(env,
         count = 0
         for step in range(n_steps):
             
-            
-            if choose_at_random(epsilon):
-                current_possible_actions = my_env.get_current_possible_actions()
-                rand_index = np.random.choice(len(current_possible_actions))
-                action = current_possible_actions[rand_index]
+            if stream.explore(epsilon):
+                action = np.array([np.flatnonzero(mask)[stream.integer(mask.sum())] + 1 for mask in valid])
             else:
-                action = qtable.get_max_action(current_state)
+                action = np.array(qtable.get_max_action(current_state, get_joint_mask(valid))).reshape(number_agents)
             
-            if number_agents == 1 :
-                reward, new_state, handles_done = my_env.step({0:action})
-            else:
-                reward, new_state, handles_done = my_env.step(dict(zip(range(number_agents),action)))
+            my_env.step(dict(enumerate(action.tolist())))
+            new_state = get_joint_state(my_env.agents)
+            new_done = my_env.agents_store.status == DONE
+            new_valid = get_valid_actions(lookup, my_env.agents, new_done)
+            reward = -float((~new_done).sum()) - conflict_penalty * len(my_env.blocked)
             
+            qtable.update_table(current_state, int(action[0]) if number_agents == 1 else tuple(action.tolist()), 
+                                new_state, reward, get_joint_mask(new_valid))
+            valid = new_valid
+            current_state, done = new_state, new_done
             count+=1
             
-            if len(handles_done) == number_agents:
+            if done.all():
                 break
+        
+        steps_per_episode.append(count)
+
+    return steps_per_episode, my_env, qtable
+
+
+def run_factored(env,
+                 n_episodes,
+                 n_steps,
+                 initial_value = 0,
+                 learning_rate = 0.8,
+                 gamma = 0.9,
+                 epsilon = 0.1,
+                 conflict_penalty = 1.,
+                 seed = None):
+    """
+    Same as run with one Q table per agent (see FactoredQTable), each agent explores on its own with 
+    probability epsilon. Agents which have reached their target stop (action 4) and are not updated anymore.
+    All the random draws come from a RandomStream seeded with seed.
+    """
+    env.reset()
+    number_agents = len(env.agents)
+    env.step(dict(zip(range(number_agents),[2]*number_agents)))
+    
+    my_env = LocalEnv(env.rail.grid, env.agents)
+    stream = RandomStream(seed)
+    qtable = FactoredQTable(LookUpTable(env.rail.grid, make_arrays=True), number_agents, 
+                            initial_value, gamma, learning_rate, conflict_penalty, stream)
+    
+    lap_time = datetime.now()
+
+    steps_per_episode = []
+    
+    for episode in range(n_episodes):
+        
+        my_env.restart_agents()
+        current_state = qtable.get_states(my_env.agents)
+        done = my_env.agents_store.status == DONE
+        
+        if episode % 100 == 0:
+            print('episode:', episode)
+            print('in', datetime.now() - lap_time)
+            lap_time = datetime.now()
+        
+        count = 0
+        for step in range(n_steps):
+            
+            action = qtable.select_actions(current_state, epsilon)
+            action[done] = 4
+            
+            my_env.step(dict(enumerate(action.tolist())))
+            new_state = qtable.get_states(my_env.agents)
+            new_done = my_env.agents_store.status == DONE
+            rewards = qtable.get_rewards(new_done, my_env.blocked)
+            
+            qtable.update_table(current_state, action, new_state, rewards, new_done, learning = ~done)
+            current_state, done = new_state, new_done
+            count+=1
             
-#            if number_agents != 1 :
-#                action = list(action)
-#                for handle in handles_done:
-#                    action[handle] = 4
-#                action = tuple(action)
-#                
-#            print('')
-#            print(current_state)
-#            print(action)
-#            print(new_state)
-            qtable.update_table(current_state, action, new_state, reward)
-            current_state = new_state
+            if done.all():
+                break
         
         steps_per_episode.append(count)
 
     return steps_per_episode, my_env, qtable
-#%%
 
-number_agents = 3#np.random.randint(1,5)
-width = 10#np.random.randint(3,20)
-height = 10#np.random.randint(3,20)
-n_start_goal = 5
-seed = 1
 
+def run_batched(env,
+                n_episodes,
+                n_steps,
+                batch_size = 64,
+                initial_value = 0,
+                learning_rate = 0.8,
+                gamma = 0.9,
+                epsilon = 0.1,
+                conflict_penalty = 1.,
+                seed = None):
+    """
+    Same as run_factored with batch_size episodes played at once on a BatchLocalEnv : at each step the
+    actions of all the copies are selected together and their transitions are applied with one
+    FactoredQTable.update_batch. A copy is restarted as soon as its episode is over (all the agents at
+    their target or n_steps steps), so the episodes of the copies are not aligned.
+    
+    Returns
+    -------
+    steps_per_episode (in the order the episodes ended), the BatchLocalEnv and the FactoredQTable
+    """
+    env.reset()
+    number_agents = len(env.agents)
+    env.step(dict(zip(range(number_agents),[2]*number_agents)))
+    
+    batch_env = BatchLocalEnv(env.rail.grid, env.agents, batch_size)
+    stream = RandomStream(seed)
+    qtable = FactoredQTable(LookUpTable(env.rail.grid, make_arrays=True), number_agents, 
+                            initial_value, gamma, learning_rate, conflict_penalty, stream)
+    
+    lap_time = datetime.now()
+
+    steps_per_episode = []
+    count = np.zeros(batch_size, dtype=int)
+    
+    while len(steps_per_episode) < n_episodes:
+        
+        current_state, done = batch_env.state.copy(), batch_env.done.copy()
+        action = qtable.select_actions(current_state, epsilon)
+        action[done] = 4
+        
+        _, new_state, new_done = batch_env.step(action)
+        rewards = -(~new_done).astype(float) - conflict_penalty * batch_env.blocked
+        
+        qtable.update_batch(current_state, action, new_state, rewards, new_done, ~done)
+        count += 1
+        
+        finished = np.flatnonzero(new_done.all(axis=1) | (count == n_steps))
+        if (len(steps_per_episode) + len(finished)) // 100 > len(steps_per_episode) // 100:
+            print('episode:', len(steps_per_episode) + len(finished))
+            print('in', datetime.now() - lap_time)
+            lap_time = datetime.now()
+        steps_per_episode += count[finished].tolist()
+        batch_env.restart_agents(finished)
+        count[finished] = 0
+
+    return steps_per_episode[:n_episodes], batch_env, qtable
+
+
+def run_planning(env,
+                 gamma = 0.9,
+                 max_updates = None):
+    """
+    Model based version of run : prioritized sweeping on the exact JointModel of the agents (speed 1 only),
+    without playing any episode.
+    
+    Returns
+    -------
+    the joint states visited by the greedy policy, the number of updates and the PrioritizedSweeping
+    """
+    env.reset()
+    number_agents = len(env.agents)
+    env.step(dict(zip(range(number_agents),[2]*number_agents)))
+    
+    my_env = LocalEnv(env.rail.grid, env.agents)
+    model = JointModel(LookUpTable(env.rail.grid, make_arrays=True), my_env.agents)
+    planner = PrioritizedSweeping(model, gamma)
+    
+    lap_time = datetime.now()
+    n_updates = planner.sweep(max_updates)
+    print(len(model), 'joint states,', n_updates, 'updates in', datetime.now() - lap_time)
+    
+    return planner.get_policy_path(), n_updates, planner
 
-env = RailEnv(width=width,
-              height=height,
-              rail_generator=complex_rail_generator(nr_start_goal=n_start_goal,
-                                                    nr_extra=3,
-                                                    min_dist=6,
-                                                    max_dist=99999,
-                                                    seed = seed),
-              schedule_generator=complex_schedule_generator(),
-              number_of_agents=number_agents,
-              obs_builder_object=TreeObsForRailEnv(max_depth=5))
-              
 
+def run_exact(env,
+              gamma = 0.9,
+              method = 'policy'):
+    """
+    Optimal values of the joint states of the agents (speed 1 only), by policy iteration (method = 'policy')
+    or value iteration (method = 'value'), to be used as a reference for the learners.
+    
+    Returns
+    -------
+    V (row 0 is the initial joint state), the number of iterations and the ExactSolver
+    """
+    env.reset()
+    number_agents = len(env.agents)
+    env.step(dict(zip(range(number_agents),[2]*number_agents)))
+    
+    my_env = LocalEnv(env.rail.grid, env.agents)
+    solver = ExactSolver(JointModel(LookUpTable(env.rail.grid, make_arrays=True), my_env.agents), gamma)
+    
+    lap_time = datetime.now()
+    if method == 'policy':
+        V, n_iterations = solver.policy_iteration()
+    elif method == 'value':
+        V, n_iterations = solver.value_iteration()
+    else:
+        raise ValueError(f"unknown method {method}, expected 'policy' or 'value'")
+    print(solver.n_states, 'joint states,', n_iterations, 'iterations in', datetime.now() - lap_time)
+    
+    return V, n_iterations, solver
 
 
-n_episodes = 6000
-n_steps = (width + height) * number_agents
+if __name__ == "__main__":
+    number_agents = 3#np.random.randint(1,5)
+    width = 10#np.random.randint(3,20)
+    height = 10#np.random.randint(3,20)
+    n_start_goal = 5
+    seed = 1
 
 
-steps_per_episode, my_env, qtable= run(env,
-        n_episodes,
-        n_steps,
-        initial_value = 0,
-        learning_rate = 0.8,
-        gamma = 0.95,
-        epsilon = 0.1)
+    env = RailEnv(width=width,
+                  height=height,
+                  rail_generator=complex_rail_generator(nr_start_goal=n_start_goal,
+                                                        nr_extra=3,
+                                                        min_dist=6,
+                                                        max_dist=99999,
+                                                        seed = seed),
+                  schedule_generator=complex_schedule_generator(),
+                  number_of_agents=number_agents,
+                  obs_builder_object=TreeObsForRailEnv(max_depth=5))
+
+
+
+
+    n_episodes = 6000
+    n_steps = (width + height) * number_agents
 
 
-renderer = RenderTool(env,agent_render_variant=3)
-renderer.reset()
-renderer.render_env(show=True, show_predictions=False, show_observations=False)
+    steps_per_episode, my_env, qtable= run(env,
+            n_episodes,
+            n_steps,
+            initial_value = 0,
+            learning_rate = 0.8,
+            gamma = 0.95,
+            epsilon = 0.1)
 
-steps_per_episode = np.array(steps_per_episode)
-plt.plot(moving_average(steps_per_episode,1000))
 
+    renderer = RenderTool(env,agent_render_variant=3)
+    renderer.reset()
+    renderer.render_env(show=True, show_predictions=False, show_observations=False)
 
+    steps_per_episode = np.array(steps_per_episode)
+    plt.plot(moving_average(steps_per_episode,1000))
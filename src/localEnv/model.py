@@ -0,0 +1,137 @@
+import numpy as np
+from collections import deque
+
+
+class JointModel():
+    def __init__(self, table, agents, max_states = 10 ** 6):
+        """
+        Exact model of LocalEnv for agents of speed 1, over the joint states reachable from the current
+        state of the agents, enumerated with a breadth first search on the compiled arrays of table
+        (a LookUpTable built with make_arrays=True).
+
+        A joint state is the tuple of the state indices (see LookUpTable.state_index) of the agents, a joint
+        action the tuple of their actions 1 to 4, encoded as a mixed radix column with the action of agent 0
+        as most significant digit (same columns as QTable). The agents move as in LocalEnv.step : in the
+        order of their handles, an agent does not move if its new cell is occupied by another agent.
+
+        Arrays (M = number of reachable joint states, A = 4 ** number of agents) :
+            states : (M, agents) state index of each agent, row 0 is the initial joint state
+            next : (M, A) index of the new joint state, -1 if the joint action is not valid
+            rewards : (M, A) minus the number of agents which are not at their target after the step
+            terminal : (M,) all the agents are at their target, no action is valid
+            predecessors, predecessor_pointer : CSR index of the (state, column) pairs leading to each
+                state, the pairs leading to state j are predecessors[predecessor_pointer[j]:predecessor_pointer[j+1]]
+
+        Parameters
+        ----------
+        table : LookUpTable
+        agents : list of agents (flatland agents or localEnv.agent.Agent)
+        max_states : int, a ValueError is raised if more joint states are reachable
+        """
+        for agent in agents:
+            speed = agent.speed if hasattr(agent, 'speed') else agent.speed_data['speed']
+            if speed != 1:
+                raise ValueError(f"agent {agent.handle} has speed {speed}, only speed 1 is modelled")
+
+        self.table = table
+        self.n_agents = len(agents)
+        self.n_actions = 4 ** self.n_agents
+        self.radix = 4 ** np.arange(self.n_agents - 1, -1, -1)
+        width = table.state_index.shape[1]
+        self.state_cell = table.states[:, 0] * width + table.states[:, 1]
+        self.target_cells = np.array([agent.target[0] * width + agent.target[1] for agent in agents])
+
+        #agent actions of each joint action column, (A, agents) in 0..3
+        self.joint_actions = (np.arange(self.n_actions)[:, None] // self.radix) % 4
+
+        initial_state = tuple(int(table.get_state_index(agent.position, agent.direction)) for agent in agents)
+        if min(initial_state) < 0:
+            raise ValueError(f"the agents are in states {initial_state}, which are not all on the rail")
+
+        self.index = {initial_state : 0}
+        states = [initial_state]
+        next_rows = []
+        queue = deque([0])
+        while queue:
+            row = queue.popleft()
+            new_states = self.__expand(np.array(states[row]))
+            next_row = np.full(self.n_actions, -1, dtype=np.int64)
+            for column in np.flatnonzero(new_states[:, 0] >= 0):
+                new_state = tuple(new_states[column].tolist())
+                if new_state not in self.index:
+                    if len(states) == max_states:
+                        raise ValueError(f"more than {max_states} joint states are reachable")
+                    self.index[new_state] = len(states)
+                    states.append(new_state)
+                    queue.append(self.index[new_state])
+                next_row[column] = self.index[new_state]
+            next_rows.append(next_row)
+
+        self.states = np.array(states, dtype=np.int64).reshape(-1, self.n_agents)
+        self.next = np.array(next_rows).reshape(-1, self.n_actions)
+
+        not_at_target = (self.state_cell[self.states] != self.target_cells).sum(axis=1)
+        self.terminal = not_at_target == 0
+        self.rewards = np.where(self.next >= 0, -not_at_target[np.maximum(self.next, 0)], 0)
+
+        #predecessors, sorted by new state
+        rows, columns = np.nonzero(self.next >= 0)
+        order = np.argsort(self.next[rows, columns], kind='stable')
+        self.predecessors = np.stack([rows[order], columns[order]], axis=1)
+        counts = np.bincount(self.next[rows, columns], minlength=len(self.states))
+        self.predecessor_pointer = np.concatenate([[0], np.cumsum(counts)])
+
+
+    def __len__(self):
+        return len(self.states)
+
+
+    def __expand(self, state):
+        """
+        returns the (A, agents) array of the new joint state for each joint action column, -1 rows for the
+        non valid joint actions (and for all of them if state is terminal)
+        """
+        if (self.state_cell[state] == self.target_cells).all():
+            return np.full((self.n_actions, self.n_agents), -1)
+
+        candidates = self.table.next_state[state[None, :], self.joint_actions]
+        valid = (candidates >= 0).all(axis=1)
+
+        new_states = np.tile(state, (self.n_actions, 1))
+        cells = self.state_cell[new_states]
+        others = ~np.eye(self.n_agents, dtype=bool)
+        for handle in range(self.n_agents):
+            new_cells = self.state_cell[np.maximum(candidates[:, handle], 0)]
+            occupied = ((cells == new_cells[:, None]) & others[handle]).any(axis=1)
+            new_states[:, handle] = np.where(occupied, state[handle], candidates[:, handle])
+            cells[:, handle] = self.state_cell[new_states[:, handle]]
+
+        new_states[~valid] = -1
+        return new_states
+
+
+    def get_predecessors(self, row):
+        """
+        returns the (n, 2) array of the (state, column) pairs leading to the joint state row
+        """
+        return self.predecessors[self.predecessor_pointer[row]:self.predecessor_pointer[row + 1]]
+
+
+    def encode_action(self, action):
+        """
+        column of the joint action (tuple of actions 1 to 4, or an int for one agent)
+        """
+        return int(np.dot(np.atleast_1d(action) - 1, self.radix))
+
+
+    def decode_action(self, column):
+        if self.n_agents == 1:
+            return int(column) + 1
+        return tuple(int(x) + 1 for x in self.joint_actions[column])
+
+
+    def get_key(self, row):
+        """
+        returns the joint state row as a tuple of ((x, y), direction), one per agent
+        """
+        return tuple(self.table.get_state(index) for index in self.states[row])
@@ -0,0 +1,158 @@
+import numpy as np
+from multiprocessing import Array, Process, Queue
+from queue import Empty
+from datetime import datetime
+
+from lookuptable import LookUpTable
+from factored_qtable import FactoredQTable
+from env import LocalEnv
+from agent import DONE
+from random_stream import RandomStream
+
+
+def as_array(shared, shape):
+    """
+    numpy view (no copy) on a multiprocessing.Array of doubles
+    """
+    return np.frombuffer(shared.get_obj()).reshape(shape)
+
+
+def actor(grid, agents, shared, shape, queue, n_episodes, n_steps, epsilon, conflict_penalty, batch_size, stream):
+    """
+    Runs n_episodes on its own LocalEnv, with an epsilon greedy policy from the Q table broadcast by the
+    learner in shared (copied at the beginning of each episode). The transitions are sent to the learner in
+    batches of about batch_size steps : (states, actions, states_, rewards, done, learning), arrays of shape
+    (steps, number of agents) (see FactoredQTable.update_batch), with the lengths of the finished episodes
+    (the transitions are None if the episodes had no step). None is sent once all the episodes are done.
+    All the random draws come from the RandomStream stream.
+    """
+    my_env = LocalEnv(grid, agents)
+    number_agents = len(agents)
+    policy = FactoredQTable(LookUpTable(grid, make_arrays=True), number_agents, 0, 0, 0, conflict_penalty, stream)
+
+    batch = []
+    episode_lengths = []
+
+    for episode in range(n_episodes):
+
+        with shared.get_lock():
+            policy.table[:] = as_array(shared, shape)
+
+        my_env.restart_agents()
+        current_state = policy.get_states(my_env.agents)
+        done = my_env.agents_store.status == DONE
+
+        count = 0
+        for step in range(n_steps):
+
+            action = policy.select_actions(current_state, epsilon)
+            action[done] = 4
+
+            my_env.step(dict(enumerate(action.tolist())))
+            new_state = policy.get_states(my_env.agents)
+            new_done = my_env.agents_store.status == DONE
+            rewards = policy.get_rewards(new_done, my_env.blocked)
+
+            batch.append((current_state, action, new_state, rewards, new_done, ~done))
+            current_state, done = new_state, new_done
+            count += 1
+
+            if done.all():
+                break
+
+        episode_lengths.append(count)
+
+        if len(batch) >= batch_size or episode == n_episodes - 1:
+            transitions = tuple(np.array(field) for field in zip(*batch)) if len(batch) > 0 else None
+            queue.put((transitions, episode_lengths))
+            batch = []
+            episode_lengths = []
+
+    queue.put(None)
+
+
+def run_parallel(env,
+                 n_workers,
+                 n_episodes,
+                 n_steps,
+                 initial_value = 0,
+                 learning_rate = 0.8,
+                 gamma = 0.9,
+                 epsilon = 0.1,
+                 conflict_penalty = 1.,
+                 batch_size = 256,
+                 broadcast_every = 1,
+                 seed = 0):
+    """
+    Actor / learner version of run_factored : n_workers processes (see actor) share the n_episodes and
+    stream their transitions to this process, which applies the double Q updates batch after batch and
+    broadcasts its Q table to the workers in shared memory every broadcast_every batches. Each worker gets
+    its own RandomStream spawned from seed (the learner too, for its double Q choices), so a run is
+    reproducible up to the order of the batches. If a worker dies the others are stopped and a RuntimeError
+    is raised.
+
+    Only the factored table can be shared this way, the joint tables (QTable, DQL.Qtable) grow with the
+    visited states and would have to be pickled at each broadcast.
+
+    Returns
+    -------
+    steps_per_episode (in the order the batches were received), qtable
+    """
+    env.reset()
+    number_agents = len(env.agents)
+    env.step(dict(zip(range(number_agents),[2]*number_agents)))
+
+    grid = np.array(env.rail.grid)
+    streams = RandomStream.spawn(seed, n_workers + 1)
+    qtable = FactoredQTable(LookUpTable(grid, make_arrays=True), number_agents,
+                            initial_value, gamma, learning_rate, conflict_penalty, streams[n_workers])
+    shape = qtable.table.shape
+    shared = Array('d', qtable.table.size)
+    as_array(shared, shape)[:] = qtable.table
+    queue = Queue(maxsize = 4 * n_workers)
+
+    episodes = [len(split) for split in np.array_split(np.arange(n_episodes), n_workers)]
+    workers = [Process(target = actor,
+                       args = (grid, env.agents, shared, shape, queue, episodes[worker], n_steps,
+                               epsilon, conflict_penalty, batch_size, streams[worker]))
+               for worker in range(n_workers)]
+    for worker in workers:
+        worker.start()
+
+    lap_time = datetime.now()
+    steps_per_episode = []
+    running = n_workers
+    n_batches = 0
+
+    while running > 0:
+        try:
+            batch = queue.get(timeout = 1)
+        except Empty:
+            #a worker which raised never sends its None
+            dead = [worker for worker in workers if worker.exitcode not in (None, 0)]
+            if len(dead) > 0:
+                for worker in workers:
+                    worker.terminate()
+                    worker.join()
+                raise RuntimeError(f"worker {workers.index(dead[0])} died with exit code {dead[0].exitcode}")
+            continue
+
+        if batch is None:
+            running -= 1
+            continue
+
+        transitions, episode_lengths = batch
+        if transitions is not None:
+            qtable.update_batch(*transitions)
+        steps_per_episode += episode_lengths
+        n_batches += 1
+
+        if n_batches % broadcast_every == 0:
+            with shared.get_lock():
+                as_array(shared, shape)[:] = qtable.table
+            print('episodes:', len(steps_per_episode), 'in', datetime.now() - lap_time)
+
+    for worker in workers:
+        worker.join()
+
+    return steps_per_episode, qtable
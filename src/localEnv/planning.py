@@ -0,0 +1,84 @@
+import numpy as np
+import heapq
+
+
+class PrioritizedSweeping():
+    def __init__(self, model, gamma, initial_value = 0, theta = 1e-6):
+        """
+        Q values of the joint states of a JointModel, computed with prioritized sweeping : the
+        (state, column) pairs are taken from a priority queue in the order of their Bellman error, and after
+        each update of a state the pairs leading to it (model.get_predecessors) are put back in the queue
+        if their error is larger than theta.
+
+        The model is deterministic so each update is a full backup Q(s,a) = r(s,a) + gamma * max Q(s',.).
+        Q is -inf for the non valid actions, V is 0 on the terminal states.
+        """
+        self.model = model
+        self.gamma = gamma
+        self.theta = theta
+        self.Q = np.where(model.next >= 0, float(initial_value), -np.inf)
+        self.n_updates = 0
+        self.queue = []
+
+
+    def get_values(self, rows):
+        values = self.Q[rows].max(axis=-1)
+        return np.where(self.model.terminal[rows], 0., values)
+
+
+    def __backup(self, rows, columns):
+        return self.model.rewards[rows, columns] + self.gamma * self.get_values(self.model.next[rows, columns])
+
+
+    def __push(self, rows, columns):
+        errors = np.abs(self.__backup(rows, columns) - self.Q[rows, columns])
+        for row, column, error in zip(rows[errors > self.theta], columns[errors > self.theta], errors[errors > self.theta]):
+            heapq.heappush(self.queue, (-error, row, column))
+
+
+    def sweep(self, max_updates = None):
+        """
+        Empties the priority queue (filled with all the valid pairs on the first call), or stops after
+        max_updates updates.
+
+        Returns
+        -------
+        int : number of updates done by this call
+        """
+        if self.n_updates == 0 and len(self.queue) == 0:
+            rows, columns = np.nonzero(self.model.next >= 0)
+            self.__push(rows, columns)
+
+        n_updates = 0
+        while self.queue and (max_updates is None or n_updates < max_updates):
+            _, row, column = heapq.heappop(self.queue)
+            value = self.get_values(row)
+            self.Q[row, column] = self.__backup(np.array([row]), np.array([column]))[0]
+            n_updates += 1
+
+            if self.get_values(row) != value:
+                predecessors = self.model.get_predecessors(row)
+                self.__push(predecessors[:, 0], predecessors[:, 1])
+
+        self.n_updates += n_updates
+        return n_updates
+
+
+    def get_max_action(self, row):
+        """
+        returns the greedy joint action of the joint state row (see JointModel.decode_action)
+        """
+        return self.model.decode_action(self.Q[row].argmax())
+
+
+    def get_policy_path(self, max_steps = 1000):
+        """
+        returns the list of the joint states (see JointModel.get_key) visited by the greedy policy from
+        the initial state
+        """
+        row = 0
+        path = [self.model.get_key(row)]
+        while not self.model.terminal[row] and len(path) <= max_steps:
+            row = self.model.next[row, self.Q[row].argmax()]
+            path.append(self.model.get_key(row))
+        return path
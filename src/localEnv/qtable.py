@@ -1,61 +1,139 @@
 import numpy as np
 from itertools import product
+from random_stream import RandomStream
+from checkpoint import Checkpoint
 
 class QTable(): #for double Q learning
-    def __init__(self, n_agents, initial_state, initial_value, gamma, lr):
+    def __init__(self, n_agents, initial_state, initial_value, gamma, lr, capacity = 1024, stream = None):
+        """
+        Double Q table stored in numpy arrays of shape (rows, actions).
+
+        index maps each state (any hashable) to its row in table, table_1 and table_2. The arrays
+        have a capacity doubled each time it is reached, only the first len(index) rows are used.
+        Joint actions are tuples of actions 1 to 4, one per agent (an int if there is only one agent),
+        encoded as a mixed radix integer with the action of agent 0 as most significant digit, so that
+        columns are in the same order as self.actions.
+        stream is the RandomStream used to choose the table to update (a new unseeded one if None).
+        """
         self.gamma = gamma
         self.learning_rate = lr
         self.initial_value = initial_value
+        self.stream = stream if stream is not None else RandomStream()
         self.n_agents = n_agents
-        self.table = {}
-        self.table_1 = {}
-        self.table_2 = {}
-        
+        self.n_actions = 4 ** n_agents
+        self.radix = 4 ** np.arange(n_agents - 1, -1, -1)
+        self.index = {}
+        self.table = np.empty((capacity, self.n_actions))
+        self.table_1 = np.empty((capacity, self.n_actions))
+        self.table_2 = np.empty((capacity, self.n_actions))
+
         def get_product_set(iterables):
             if len(iterables) == 1 :
                 return iterables[0]
             else:
                 return list(product(*iterables))
-            
+
         self.actions = get_product_set([[1,2,3,4]]*n_agents)
-        self.add_state(initial_state,self.actions)
-        
-        
-        
-    def add_state(self, state, action):
-        to_zip = [self.initial_value]*len(action)
-        self.table[state] = dict(zip(action, to_zip))
-        self.table_1[state] = dict(zip(action, to_zip))
-        self.table_2[state] = dict(zip(action, to_zip))
-        
-    def update_table(self, state, action, state_, reward):
-        
-        choice = np.random.choice([1,2])
-        
-        if state_ not in list(self.table.keys()):
-            self.add_state(state_, self.actions)
-            if choice == 1:
-                self.table_1[state][action] += self.learning_rate * \
-                                                    ( reward + self.gamma * self.initial_value \
-                                                    - self.table_1[state][action]) 
-            else:
-                self.table_2[state][action] += self.learning_rate * \
-                                    ( reward + self.gamma * self.initial_value \
-                                    - self.table_2[state][action]) 
+        self.add_state(initial_state)
+
+
+    def encode_action(self, action):
+        """
+        returns the column of the joint action
+        """
+        if self.n_agents == 1:
+            return action - 1
+        return int(np.dot(np.asarray(action) - 1, self.radix))
+
+
+    def decode_action(self, column):
+        """
+        returns the joint action of the column
+        """
+        if self.n_agents == 1:
+            return int(column) + 1
+        return tuple(int(x) + 1 for x in (column // self.radix) % 4)
+
+
+    def __grow(self):
+        capacity = max(2 * len(self.table), 1)
+        for name in ('table', 'table_1', 'table_2'):
+            old = getattr(self, name)
+            new = np.empty((capacity, self.n_actions))
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+
+    def add_state(self, state):
+        row = len(self.index)
+        if row == len(self.table):
+            self.__grow()
+        self.index[state] = row
+        self.table[row] = self.initial_value
+        self.table_1[row] = self.initial_value
+        self.table_2[row] = self.initial_value
+        return row
+
+    def update_table(self, state, action, state_, reward, valid = None):
+        """
+        double Q update of the entry (state, action), valid (array of bool) are the columns of the valid joint
+        actions in state_ if given : the value of state_ is then the one of its best valid action
+        """
+        choice = self.stream.coin()
+        row = self.index[state]
+        column = self.encode_action(action)
+
+        if state_ not in self.index:
+            self.add_state(state_)
+            next_value = self.initial_value
         else:
-            if choice == 1:
-                t1_max_action_for_state_ =  max(self.table_1[state_], key = self.table_1[state_].get)
-                self.table_1[state][action] += self.learning_rate * \
-                                                    ( reward + self.gamma * self.table_2[state_][t1_max_action_for_state_] \
-                                                    - self.table_1[state][action]) 
-            else:
-                t2_max_action_for_state_ =  max(self.table_2[state_], key = self.table_2[state_].get)
-                self.table_2[state][action] += self.learning_rate * \
-                                                    ( reward + self.gamma * self.table_1[state_][t2_max_action_for_state_] \
-                                                    - self.table_2[state][action]) 
+            row_ = self.index[state_]
+            chooser, evaluator = (self.table_1, self.table_2) if choice == 1 else (self.table_2, self.table_1)
+            values = chooser[row_] if valid is None else np.where(valid, chooser[row_], -np.inf)
+            next_value = evaluator[row_, values.argmax()]
+
+        if choice == 1:
+            self.table_1[row, column] += self.learning_rate * \
+                                            ( reward + self.gamma * next_value - self.table_1[row, column])
+        else:
+            self.table_2[row, column] += self.learning_rate * \
+                                            ( reward + self.gamma * next_value - self.table_2[row, column])
+
+        #only this entry of the averaged table changed
+        self.table[row, column] = .5*(self.table_1[row, column] + self.table_2[row, column])
+
+    def get_max_action(self, state, valid = None):
+        """
+        returns the greedy joint action of state, among the columns where valid (array of bool) is True if given
+        """
+        values = self.table[self.index[state]]
+        if valid is not None:
+            values = np.where(valid, values, -np.inf)
+        return self.decode_action(values.argmax())
+
+
+    def save(self, directory):
+        """
+        saves the states and the rows of the tables in directory (see checkpoint.Checkpoint), if the table
+        was already saved there the new states are appended and the rows are written to a new generation
+        """
+        n_rows = len(self.index)
+        Checkpoint(directory).save({name : getattr(self, name)[:n_rows] for name in ('table', 'table_1', 'table_2')},
+                                   list(self.index.keys()))
 
-        for action in self.actions:
-            self.table[state][action] = .5*(self.table_1[state][action] + self.table_2[state][action])
 
-    def get_max_action(self, state):
-        return max(self.table[state], key = self.table[state].get)
\ No newline at end of file
+    def load(self, directory):
+        """
+        replaces the states and the rows of the tables by the ones saved in directory. The tables are copy on
+        write maps of the files (see checkpoint.Checkpoint.open), so a large table is opened without being
+        read : the rows are read when they are used, the updates stay in memory (the files only change with
+        save) and the tables are copied to memory the next time they grow.
+        """
+        checkpoint = Checkpoint(directory)
+        states = checkpoint.load_keys()
+        arrays = checkpoint.open(mode='c')
+        if len(states) != len(arrays['table']):
+            raise ValueError(f"the {len(arrays['table'])} rows saved in {directory} are not indexed by states")
+        for name in ('table', 'table_1', 'table_2'):
+            setattr(self, name, arrays[name])
+        self.index = dict(zip(states, range(len(states))))
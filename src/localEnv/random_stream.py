@@ -0,0 +1,91 @@
+import numpy as np
+
+
+class RandomStream():
+    def __init__(self, seed = None, buffer_size = 4096):
+        """
+        Uniform numbers in [0,1) drawn buffer_size at a time from a numpy Generator, so that a draw during
+        an episode is an array read instead of a call to np.random. Two streams with the same seed give
+        the same numbers (see spawn for independent streams, e.g. one per worker).
+        """
+        self.generator = np.random.default_rng(seed)
+        self.buffer_size = buffer_size
+        self.__buffer = np.empty(0)
+        self.__position = 0
+
+
+    @classmethod
+    def spawn(cls, seed, n_streams, buffer_size = 4096):
+        """
+        returns n_streams independent streams, reproducible from seed
+        """
+        return [cls(child, buffer_size) for child in np.random.SeedSequence(seed).spawn(n_streams)]
+
+
+    def random(self):
+        if self.__position == len(self.__buffer):
+            self.__buffer = self.generator.random(self.buffer_size)
+            self.__position = 0
+        self.__position += 1
+        return self.__buffer[self.__position - 1]
+
+
+    def random_array(self, size):
+        """
+        returns an array of shape size of uniform numbers, read from the buffer (which is refilled with at
+        least size numbers when it does not hold enough of them)
+        """
+        n = int(np.prod(size))
+        if self.__position + n > len(self.__buffer):
+            remaining = self.__buffer[self.__position:]
+            self.__buffer = np.concatenate((remaining, self.generator.random(max(self.buffer_size, n))))
+            self.__position = 0
+        self.__position += n
+        return self.__buffer[self.__position - n:self.__position].reshape(size)
+
+
+    def explore(self, epsilon):
+        """
+        True with probability epsilon
+        """
+        return self.random() < epsilon
+
+
+    def integer(self, n):
+        """
+        uniform integer in range(n)
+        """
+        return int(self.random() * n)
+
+
+    def coin(self):
+        """
+        1 or 2 with probability 1/2, the table to update in double Q learning
+        """
+        return 1 if self.random() < .5 else 2
+
+
+def select_actions(values, valid, epsilon, stream):
+    """
+    Epsilon greedy selection for a batch of states.
+
+    Parameters
+    ----------
+    values : array of shape (batch, actions), Q values of the states, the batch can have several dimensions
+             (e.g. (copies, agents, actions) for BatchLocalEnv)
+    valid : array of bool, same shape, mask of the valid actions
+    epsilon : float
+    stream : RandomStream
+
+    Returns
+    -------
+    array of int of shape (batch,) : column of the chosen action of each state, the greedy valid action
+    or, with probability epsilon, a valid action drawn uniformly
+    """
+    greedy = np.where(valid, values, -np.inf).argmax(axis=-1)
+
+    draws = stream.random_array((2,) + values.shape[:-1])
+    cumulative = valid.cumsum(axis=-1)
+    random = (cumulative > (draws[1] * cumulative[..., -1]).astype(int)[..., None]).argmax(axis=-1)
+
+    return np.where(draws[0] < epsilon, random, greedy)
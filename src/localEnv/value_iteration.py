@@ -0,0 +1,108 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
+
+
+class ExactSolver():
+    def __init__(self, model, gamma):
+        """
+        Value and policy iteration on the joint states of a JointModel, with the transitions stored in a
+        sparse matrix : row k of P is the valid (state, column) pair k and has a single 1 in the column of
+        the new joint state. The pairs are sorted by state so the max over the actions of a state is a
+        np.maximum.reduceat. Terminal states have no pair and a value of 0.
+        """
+        self.model = model
+        self.gamma = gamma
+        self.n_states = len(model)
+
+        self.pair_states, self.pair_columns = np.nonzero(model.next >= 0)
+        new_states = model.next[self.pair_states, self.pair_columns]
+        self.n_pairs = len(self.pair_states)
+        self.P = sparse.csr_matrix((np.ones(self.n_pairs), (np.arange(self.n_pairs), new_states)),
+                                   shape=(self.n_pairs, self.n_states))
+        self.r = model.rewards[self.pair_states, self.pair_columns].astype(float)
+
+        #first pair of each non terminal state
+        self.active = np.flatnonzero(~model.terminal)
+        self.pair_pointer = np.searchsorted(self.pair_states, self.active)
+
+
+    def get_pair_values(self, V):
+        """
+        returns the value of each pair, r + gamma * P V
+        """
+        return self.r + self.gamma * (self.P @ V)
+
+
+    def get_q_values(self, V):
+        """
+        returns the (states, columns) Q values for the values V, -inf for the non valid actions
+        """
+        Q = np.full(self.model.next.shape, -np.inf)
+        Q[self.pair_states, self.pair_columns] = self.get_pair_values(V)
+        return Q
+
+
+    def __greedy(self, V):
+        """
+        returns the max over the pairs of each non terminal state and the index of the pair reaching it
+        """
+        values = self.get_pair_values(V)
+        best = np.maximum.reduceat(values, self.pair_pointer)
+        is_best = values >= np.repeat(best, np.diff(np.append(self.pair_pointer, self.n_pairs))) - 1e-12
+        first = np.minimum.reduceat(np.where(is_best, np.arange(self.n_pairs), self.n_pairs), self.pair_pointer)
+        return best, first
+
+
+    def value_iteration(self, tolerance = 1e-8, max_iterations = 100000):
+        """
+        Returns
+        -------
+        V : (states,) optimal values
+        int : number of iterations
+        """
+        V = np.zeros(self.n_states)
+        for iteration in range(1, max_iterations + 1):
+            best, _ = self.__greedy(V)
+            delta = np.abs(best - V[self.active]).max() if len(self.active) > 0 else 0.
+            V[self.active] = best
+            if delta < tolerance:
+                break
+        return V, iteration
+
+
+    def policy_iteration(self, max_iterations = 1000):
+        """
+        Policy evaluation solves (I - gamma P_pi) V = r_pi with spsolve, the improvement keeps the action of
+        the current policy when it is still among the best ones.
+
+        Returns
+        -------
+        V : (states,) optimal values
+        int : number of iterations
+        """
+        policy = self.pair_pointer.copy()
+        identity = sparse.identity(len(self.active), format='csr')
+        for iteration in range(1, max_iterations + 1):
+            P_pi = self.P[policy][:, self.active]
+            V = np.zeros(self.n_states)
+            V[self.active] = spsolve((identity - self.gamma * P_pi).tocsc(), self.r[policy])
+
+            best, first = self.__greedy(V)
+            values = self.get_pair_values(V)
+            keep = values[policy] >= best - 1e-9
+            new_policy = np.where(keep, policy, first)
+            if (new_policy == policy).all():
+                break
+            policy = new_policy
+        return V, iteration
+
+
+    def get_policy(self, V):
+        """
+        returns the greedy column of each joint state (-1 on terminal states)
+        """
+        policy = np.full(self.n_states, -1)
+        _, first = self.__greedy(V)
+        policy[self.active] = self.pair_columns[first]
+        return policy
@@ -4,6 +4,13 @@ from flatland.envs.rail_generators import complex_rail_generator
 from flatland.envs.schedule_generators import complex_schedule_generator
 from datetime import datetime
 from itertools import product
+from inspect import signature
+from src.localEnv.random_stream import RandomStream
+from src.localEnv.checkpoint import Checkpoint
+from src.graph.transitions import TransitionTable
+
+#NESW
+COORDINATE_OFFSET = ((-1, 0), (0, 1), (1, 0), (0, -1))
 
 def moving_average(a, n=3) :
     ret = np.cumsum(a, dtype=float)
@@ -11,11 +18,6 @@ def moving_average(a, n=3) :
     return ret[n - 1:] / n
 
 
-def choose_at_random(epsilon):
-    decision = [0, 1]
-    proba = [1-epsilon, epsilon]
-    return np.random.choice(decision, p=proba)
-
 def get_agent_state(env, handle, start = False):
     if start == True:
         return((env.agents[handle].initial_position[0],env.agents[handle].initial_position[1],env.agents[handle].direction))
@@ -37,10 +39,188 @@ def get_product_set(iterables):
         return list(product(*iterables))
 
 
+class QStorage():
+    
+    def __init__(self, n_columns, capacity = 1024):
+        '''
+        Rows of the double Q table stored in float arrays Q, Q_1 and Q_2 of shape (capacity, n_columns) 
+        and a mask of the valid actions of each row. The capacity is doubled each time it is reached, 
+        only the first n_rows rows are used. Non valid actions have a value of 0.
+        '''
+        self.n_rows = 0
+        self.n_columns = n_columns
+        self.Q = np.zeros((capacity, n_columns))
+        self.Q_1 = np.zeros((capacity, n_columns))
+        self.Q_2 = np.zeros((capacity, n_columns))
+        self.valid = np.zeros((capacity, n_columns), dtype = bool)
+    
+    def __len__(self):
+        return self.n_rows
+    
+    def __grow(self):
+        capacity = max(2 * len(self.valid), 1)
+        for name in ('Q', 'Q_1', 'Q_2', 'valid'):
+            old = getattr(self, name)
+            new = np.zeros((capacity, self.n_columns), dtype = old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+    
+    def get_arrays(self):
+        '''
+        used rows of the arrays, by name
+        '''
+        return {name : getattr(self, name)[:self.n_rows] for name in ('Q', 'Q_1', 'Q_2', 'valid')}
+    
+    def set_arrays(self, arrays):
+        '''
+        replaces the rows by the ones of arrays (dict name -> array, see get_arrays), the arrays are used 
+        as they are (e.g. memory maps) until the next row is added
+        '''
+        self.n_rows = len(arrays['Q'])
+        for name in ('Q', 'Q_1', 'Q_2', 'valid'):
+            setattr(self, name, arrays[name])
+    
+    def add_row(self, valid_columns, init_val):
+        '''
+        add a row where the actions valid_columns (indices or boolean mask) have value init_val
+        and return its index
+        '''
+        if self.n_rows == len(self.valid):
+            self.__grow()
+        row = self.n_rows
+        self.valid[row, valid_columns] = True
+        self.Q[row, valid_columns] = init_val
+        self.Q_1[row, valid_columns] = init_val
+        self.Q_2[row, valid_columns] = init_val
+        self.n_rows += 1
+        return row
+    
+    def argmax(self, table, row):
+        '''
+        column of the valid action with the highest value in the row of table (Q, Q_1 or Q_2)
+        '''
+        return np.where(self.valid[row], table[row], -np.inf).argmax()
+
+
+class ConvergenceMonitor():
+    
+    def __init__(self):
+        '''
+        Tracks the changes of Qtable.Q since the last checkpoint without copying the table: the value of 
+        an entry is saved the first time it is updated after the checkpoint. Only the rows existing at the 
+        checkpoint are tracked, so the cost of a checkpoint is proportional to the number of updates.
+        '''
+        self.n_rows = None
+        self.old_values = {}
+    
+    def start(self, n_rows):
+        '''
+        set a checkpoint, the rows 0 to n_rows - 1 will be tracked
+        '''
+        self.n_rows = n_rows
+        self.old_values = {}
+    
+    def record(self, row, column, old_value):
+        if self.n_rows is not None and row < self.n_rows and (row, column) not in self.old_values:
+            self.old_values[(row, column)] = old_value
+    
+    def get_row_changes(self, Q):
+        '''
+        return the rows updated since the checkpoint, the sum over their actions of the absolute 
+        change of Q and the number of entries of Q which changed
+        '''
+        if len(self.old_values) == 0:
+            return np.zeros(0, dtype = int), np.zeros(0), 0
+        entries = np.array(list(self.old_values.keys()))
+        delta = Q[entries[:, 0], entries[:, 1]] - np.array(list(self.old_values.values()))
+        rows, inverse = np.unique(entries[:, 0], return_inverse = True)
+        changes = np.zeros(len(rows))
+        np.add.at(changes, inverse, np.abs(delta))
+        return rows, changes, np.count_nonzero(delta)
+    
+    def checkpoint(self, Q, number_agents):
+        '''
+        return the infinity norm of the change of Q since the last checkpoint (max over the rows of the sum 
+        of the absolute changes), -1 if nothing changed, and set a new checkpoint
+        '''
+        _, changes, n_changed = self.get_row_changes(Q)
+        delta_norm = changes.max() if len(changes) > 0 else 0.
+        print(delta_norm / 5 ** number_agents)
+        self.start(len(Q))
+        if n_changed != 0:
+            return delta_norm
+        else:
+            return -1
+
+
+class TransitionCache():
+    
+    def __init__(self, grid, n_actions = 5):
+        '''
+        Valid actions and successor state of a single agent for every (cell, direction) of the grid, 
+        computed once with the same rules as RailEnv._check_action_on_agent. Action 4 is always valid 
+        and keeps the agent in its state.
+        
+        valid_actions[(x, y, direction)] is a mask of length n_actions and 
+        successors[(x, y, direction)] the list of the new states (None if the action is not valid)
+        '''
+        self.grid = np.array(grid)
+        self.decoded = TransitionTable(self.grid).get_transitions()
+        self.n_actions = n_actions
+        self.valid_actions = {}
+        self.successors = {}
+        for x, y in zip(*self.grid.nonzero()):
+            for direction in range(4):
+                state = (int(x), int(y), direction)
+                self.valid_actions[state], self.successors[state] = self.__expand(state)
+    
+    def __expand(self, state):
+        x, y, direction = state
+        transitions = [int(bit) for bit in self.decoded[x, y, direction]]
+        n_transitions = sum(transitions)
+        
+        mask = np.zeros(self.n_actions, dtype = bool)
+        successors = [None] * self.n_actions
+        for action in range(self.n_actions - 1):
+            #same as RailEnv.check_action
+            transition_valid = None
+            new_direction = direction
+            if action == 1:
+                new_direction = direction - 1
+                if n_transitions <= 1:
+                    transition_valid = False
+            elif action == 3:
+                new_direction = direction + 1
+                if n_transitions <= 1:
+                    transition_valid = False
+            new_direction %= 4
+            if action == 2 and n_transitions == 1:
+                new_direction = transitions.index(1)
+                transition_valid = True
+            if transition_valid is None:
+                transition_valid = transitions[new_direction] == 1
+            
+            if transition_valid:
+                dx, dy = COORDINATE_OFFSET[new_direction]
+                mask[action] = True
+                successors[action] = (x + dx, y + dy, new_direction)
+        
+        mask[self.n_actions - 1] = True
+        successors[self.n_actions - 1] = state
+        return mask, successors
+    
+    def get_valid_actions(self, state):
+        return self.valid_actions[state]
+    
+    def get_successor(self, state, action):
+        return self.successors[state][action]
+
+
 class Qtable():
     
-    def __init__(self, env, init_val, learning_rate, gamma, n_actions = 5, n_directions = 4):
+    def __init__(self, env, init_val, learning_rate, gamma, n_actions = 5, n_directions = 4, stream = None):
         self.env = env
+        self.stream = stream if stream is not None else RandomStream()
         self.n_agents = len(self.env.agents)
         if self.n_agents == 1:
             self.starting_positions = tuple([self.env.agents[0].initial_position[0], self.env.agents[0].initial_position[1], self.env.agents[0].direction])   
@@ -51,94 +231,117 @@ class Qtable():
         self.init_v = init_val
         self.lr = learning_rate
         self.y = gamma
+        #joint actions are encoded in mixed radix with the action of agent 0 as most significant digit,
+        #the columns are in the same order as get_product_set
+        self.radix = n_actions ** np.arange(self.n_agents - 1, -1, -1)
         self.dico = {get_agent_states(self.env, start = True) : 0}
+        self.storage = QStorage(n_actions ** self.n_agents)
+        self.monitor = ConvergenceMonitor()
+        self.transitions = TransitionCache(self.env.rail.grid, n_actions)
         if len(env.agents) == 1:
-            self.Q_1 = np.array([[{2 : 0}]])
-            self.Q_2 = np.array([[{2 : 0}]])
-            self.Q = np.array([[{2 : 0}]])
+            self.storage.add_row([self.encode_action(2)], 0)
         else:
-            self.Q_1 = np.array([[{tuple([2]*self.n_agents) : 0}]])
-            self.Q_2 = np.array([[{tuple([2]*self.n_agents) : 0}]])
-            self.Q = np.array([[{tuple([2]*self.n_agents) : 0}]])
+            self.storage.add_row([self.encode_action(tuple([2]*self.n_agents))], 0)
+    
+    @property
+    def Q(self):
+        return self.storage.Q[:len(self.storage)]
+    
+    def encode_action(self, action):
+        if self.n_agents == 1:
+            return action
+        return int(np.dot(action, self.radix))
+    
+    def decode_action(self, column):
+        if self.n_agents == 1:
+            return int(column)
+        return tuple(int(x) for x in (column // self.radix) % self.n_actions)
+    
+    def get_agent_states_list(self, state):
+        if self.n_agents == 1:
+            return [state]
+        return list(state)
+    
+    def get_valid_mask(self, state):
+        '''
+        mask of the valid joint actions of state, in the order of the columns : outer product of the 
+        masks of the agents, agent 0 being the most significant digit
+        '''
+        mask = np.ones(1, dtype = bool)
+        for agent_state in self.get_agent_states_list(state):
+            mask = (mask[:, None] & self.transitions.get_valid_actions(agent_state)[None, :]).ravel()
+        return mask
+    
+    def get_successor(self, state, action):
+        '''
+        state reached from state with the (joint) action, the action must be valid
+        '''
+        if self.n_agents == 1:
+            return self.transitions.get_successor(state, action)
+        return tuple(self.transitions.get_successor(agent_state, agent_action) 
+                     for agent_state, agent_action in zip(state, action))
     
-    def get_agent_next_step(self, handle):
-        #NESW
-        possible_agent_actions = []
-        new_agent_states = []
-
-        for action in range(self.n_actions-1):
-            cell_free, \
-            new_cell_valid, \
-            new_direction, \
-            new_position, \
-            transition_valid = self.env._check_action_on_agent(action, self.env.agents[handle])
-            
-            if transition_valid in [True, 1]:
-                possible_agent_actions.append(action)
-                new_agent_states.append(tuple(list(new_position) + [new_direction]))
-                
-        #action 4 is badly handled : bad next position
-        possible_agent_actions.append(4)
-        new_agent_states.append(get_agent_state(self.env, handle))      
-        
-        return possible_agent_actions, new_agent_states
-
     def get_next_step(self, state):
-        #NESW
-        possible_actions = []
-        new_states = []
-
-        for handle in range(self.n_agents):
-            possible_agent_actions, new_agent_states = self.get_agent_next_step(handle)
-            possible_actions.append(possible_agent_actions)
-            new_states.append(new_agent_states)        
-        
-        possible_actions = get_product_set(possible_actions)
-        new_states = get_product_set(new_states)
-            
-        return possible_actions, new_states
-        
+        '''
+        generator of the valid joint actions of state and of the corresponding new states, the joint 
+        actions are decoded one at a time from the valid columns
+        '''
+        for column in np.flatnonzero(self.get_valid_mask(state)):
+            action = self.decode_action(column)
+            yield action, self.get_successor(state, action)
 
     def add_row(self, state):
-        possible_actions, new_states = self.get_next_step(state)
-        action_dict = dict(zip(possible_actions,[self.init_v]*len(possible_actions)))
-
-        self.Q = np.vstack((self.Q, action_dict))
-        self.Q_1 = np.vstack((self.Q_1, action_dict))
-        self.Q_2 = np.vstack((self.Q_2, action_dict))
-
-        return len(self.Q)-1        
+        return self.storage.add_row(self.get_valid_mask(state), self.init_v)
     
     def update(self, state, state_, action, reward):
         if state_ not in self.dico.keys():
             self.dico[state_] = self.add_row(state_)       
-                 
-        choice = np.random.choice([1,2])
+        
+        storage = self.storage
+        row, row_ = self.dico[state], self.dico[state_]
+        column = self.encode_action(action)
+        choice = self.stream.coin()
         if choice == 1:
-            Q_1_max_value_action_for_state_ = max(self.Q_1[self.dico[state_]][0], key = self.Q_1[self.dico[state_]][0].get) 
-            self.Q_1[self.dico[state]][0][action] += self.lr * (reward + self.y * \
-                                                    self.Q_2[self.dico[state_]][0][Q_1_max_value_action_for_state_] \
-                                                    - self.Q_1[self.dico[state]][0][action])
+            Q_1_max_value_action_for_state_ = storage.argmax(storage.Q_1, row_)
+            storage.Q_1[row, column] += self.lr * (reward + self.y * \
+                                                    storage.Q_2[row_, Q_1_max_value_action_for_state_] \
+                                                    - storage.Q_1[row, column])
         else:
-            Q_2_max_value_action_for_state_ = max(self.Q_2[self.dico[state_]][0], key = self.Q_2[self.dico[state_]][0].get) 
-            self.Q_2[self.dico[state]][0][action] += self.lr * (reward + self.y * \
-                                                    self.Q_1[self.dico[state_]][0][Q_2_max_value_action_for_state_] \
-                                                    - self.Q_2[self.dico[state]][0][action])
-        
-        row_Q_1 = self.Q_1[self.dico[state]][0]
-        row_Q_2 = self.Q_2[self.dico[state]][0]
-        row_Q = {}
-        for key in row_Q_1.keys():
-            row_Q[key] = (row_Q_1[key] + row_Q_2[key])/2
+            Q_2_max_value_action_for_state_ = storage.argmax(storage.Q_2, row_)
+            storage.Q_2[row, column] += self.lr * (reward + self.y * \
+                                                    storage.Q_1[row_, Q_2_max_value_action_for_state_] \
+                                                    - storage.Q_2[row, column])
         
-        self.Q[self.dico[state]][0] = row_Q
+        #only this entry of the averaged row changed
+        self.monitor.record(row, column, storage.Q[row, column])
+        storage.Q[row, column] = (storage.Q_1[row, column] + storage.Q_2[row, column])/2
         
     def valid_actions(self, state):
-        row_Q_1 = self.Q_1[self.dico[state]][0]
-        return list(row_Q_1.keys())
+        return [self.decode_action(column) for column in np.flatnonzero(self.storage.valid[self.dico[state]])]
         
     def find_max_action(self, state):
-        return max(self.Q[self.dico[state]][0], key = self.Q[self.dico[state]][0].get)
+        return self.decode_action(self.storage.argmax(self.storage.Q, self.dico[state]))
+    
+    def save(self, directory):
+        '''
+        saves the states and the rows of the table in directory (see Checkpoint), if the table was already 
+        saved there the new states are appended and the rows are written to a new generation
+        '''
+        Checkpoint(directory).save(self.storage.get_arrays(), list(self.dico.keys()))
+    
+    def load(self, directory):
+        '''
+        replaces the states and rows of the table by the ones saved in directory, e.g. to resume a run or 
+        as a warm start on a similar grid. The rows are copy on write maps of the files (see 
+        Checkpoint.open): they are read when used and copied to memory when the table grows
+        '''
+        checkpoint = Checkpoint(directory)
+        states = checkpoint.load_keys()
+        arrays = checkpoint.open(mode = 'c')
+        if len(states) != len(arrays['Q']):
+            raise ValueError(f"the {len(arrays['Q'])} rows saved in {directory} are not indexed by states")
+        self.storage.set_arrays(arrays)
+        self.dico = dict(zip(states, range(len(states))))
     
     def get_policy_paths(self, env):
         self.env = env
@@ -154,8 +357,7 @@ class Qtable():
             print(positions)
             print(max_action)
 
-            possible_action, new_states = self.get_next_step(positions)
-            positions = new_states[possible_action.index(max_action)]
+            positions = self.get_successor(positions, max_action)
             paths.append(positions)
             
             if len(env.agents) == 1:
@@ -187,38 +389,20 @@ def create_env(number_agents,width,height,n_start_goal,seed):
     
     return env   
 
-def get_delta(Q_old, Q_old_index, Q, Q_index, number_agents):
-
-
-    index_actions = get_product_set([[0,1,2,3,4]] * number_agents)
-    index_actions = dict(zip(index_actions, list(range(len(index_actions)))))
-
-    #Build newly formatted Q and Q_old
-    Q_matrix = np.zeros((len(Q_index),len(index_actions)))
-    Q_matrix_old = np.zeros((len(Q_old_index),len(index_actions)))
-    delta = np.zeros((len(Q_index),len(index_actions)))
-    #update Q_old
-    for state in Q_old_index.keys():
-        for action in index_actions.keys():
-            if action in Q_old[Q_old_index[state]][0].keys() :
-                Q_matrix_old[Q_old_index[state], index_actions[action]] = Q_old[Q_old_index[state]][0][action]
-    
-    #update Q
-    for state in Q_index.keys():
-        for action in index_actions.keys():
-            if action in Q[Q_index[state]][0].keys() :
-                Q_matrix[Q_index[state], index_actions[action]] = Q[Q_index[state]][0][action]
-
-    #Compute difference               
-    for state in Q_old_index.keys():
-        for action in index_actions.keys():
-            delta[Q_old_index[state],index_actions[action]] = Q_matrix[Q_old_index[state],index_actions[action]] - Q_matrix_old[Q_old_index[state],index_actions[action]] 
-    
-    print(np.linalg.norm(delta,np.inf) / len(index_actions))
-    if np.count_nonzero(delta) != 0:
-        return np.linalg.norm(delta,np.inf/len(index_actions))
-    else: 
-        return -1
+#flatland-rl 2.1.8 (pinned in requirements.txt) can reset an env without regenerating the rail and the schedule
+RESET_KEEPS_RAIL = {'regenerate_rail', 'regenerate_schedule'} <= set(signature(RailEnv.reset).parameters)
+
+def restore_env(env, rebuild):
+    '''
+    puts env back in the state of the beginning of an episode with flatland's own reset, without 
+    regenerating the rail nor the schedule (much cheaper than generating a new env with the same seed).
+    With a version of flatland whose reset does not take these keywords, returns a new env built by 
+    rebuild() instead (e.g. create_env with the same seed)
+    '''
+    if not RESET_KEEPS_RAIL:
+        return rebuild()
+    env.reset(regenerate_rail = False, regenerate_schedule = False)
+    return env
 
 def run(number_agents,
             width,height,
@@ -230,45 +414,52 @@ def run(number_agents,
             learning_rate = 0.8,
             gamma = 0.9,
             epsilon = 0.1,
-            threshold = 0.3):
+            threshold = 0.3,
+            random_seed = None,
+            checkpoint_directory = None,
+            results_writer = None):
+    '''
+    if results_writer (a ResultsWriter, see src.benchmark.results) is given, a record of the run is
+    written to it before returning
+    '''
     
     env = create_env(number_agents,width,height,n_start_goal,seed)
     total_rewards_by_episode = []
     delta_norms = []
 
-    Q_table = Qtable(env, initial_value, learning_rate, gamma)
+    stream = RandomStream(random_seed)
+    Q_table = Qtable(env, initial_value, learning_rate, gamma, stream = stream)
+    if checkpoint_directory is not None and Checkpoint(checkpoint_directory).exists():
+        Q_table.load(checkpoint_directory)
     total_time = datetime.now()
 
     for episode in range(n_episodes):
 
-        index_actions = get_product_set([[0,1,2,3,4]] * number_agents)
-        index_actions = dict(zip(index_actions, list(range(len(index_actions)))))
-
+        if checkpoint_directory is not None and episode % 100 == 0 and episode > 0:
+            Q_table.save(checkpoint_directory)
+        
         if episode == 100:        
-            Q_old = Q_table.Q.copy()
-            Q_old_index = Q_table.dico.copy()               
+            Q_table.monitor.start(len(Q_table.Q))
         elif episode % 100 == 0 and episode>100:              
-            delta_norm= get_delta(Q_old, Q_old_index, Q_table.Q.copy(), Q_table.dico.copy(), number_agents)
+            delta_norm = Q_table.monitor.checkpoint(Q_table.Q, number_agents)
             delta_norms.append(delta_norm)
-            Q_old = Q_table.Q.copy()      
-            Q_old_index = Q_table.dico.copy()
         
         if episode > 500:
             if np.array(delta_norms[-3:]).mean() < threshold:
-                return -(max(total_rewards_by_episode) -1), episode, datetime.now() - total_time     
+                return write_result(results_writer, env, seed, -(max(total_rewards_by_episode) -1), episode, 
+                                    datetime.now() - total_time)
        
         epsilon = min(1,(np.log(episode + 2) / (episode +1 )) * (number_agents)**4)
         step = 0
         total_reward = 0
         position = get_agent_states(env, start = True) 
         done = False
-        np.random.seed()
                 
         while step < n_steps:
             
-            if choose_at_random(epsilon):
-                action_index = np.random.choice(len(Q_table.valid_actions(position)))
-                action = Q_table.valid_actions(position)[action_index]
+            if stream.explore(epsilon):
+                valid_actions = Q_table.valid_actions(position)
+                action = valid_actions[stream.integer(len(valid_actions))]
             else:
                 action = Q_table.find_max_action(position)
                 
@@ -299,11 +490,29 @@ def run(number_agents,
             
         total_rewards_by_episode.append(total_reward)
         
-        env = create_env(number_agents,width,height,n_start_goal,seed)
-           
+        env = restore_env(env, lambda: create_env(number_agents,width,height,n_start_goal,seed))
         Q_table.env = env
         
-    return -(max(total_rewards_by_episode) -1), -1, datetime.now() - total_time
+    return write_result(results_writer, env, seed, -(max(total_rewards_by_episode) -1), -1, datetime.now() - total_time)
+
+
+def write_result(results_writer, env, seed, score, episode, total_time):
+    '''
+    writes the record of a run to results_writer (if not None) and returns the results of run
+    '''
+    if results_writer is not None:
+        #imported here so that pandas and pyarrow are only needed to write results
+        from src.benchmark.results import grid_size
+        results_writer.write({'method' : 'Q-learning',
+                              'grid_size' : grid_size(env.width, env.height),
+                              'width' : env.width,
+                              'height' : env.height,
+                              'agents' : len(env.agents),
+                              'seed' : seed,
+                              'score' : float(score),
+                              'episodes' : episode,
+                              'time' : total_time.total_seconds()})
+    return score, episode, total_time
         
 
 
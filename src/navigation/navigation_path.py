@@ -2,6 +2,14 @@ import numpy as np
 import time
 from src.visualization.graphic import draw_multiple_paths
 
+#heading of a step indexed by the offset (row + 1, column + 1) between two cells, -1 if the agent stays
+HEADING_FROM_OFFSET = np.array([[-1, 0, -1],
+                                [3, -1, 1],
+                                [-1, 2, -1]])
+
+#action to take indexed by (new heading - old heading) % 4, going backward is only possible at a dead-end
+ACTION_FROM_TURN = np.array([2, 3, 2, 1])
+
 def l2_norm(v, u):
     """
     computes L² norm of vector difference
@@ -84,6 +92,57 @@ def actions_for_path(path,direction):
         
     return actions
 
+def compile_actions(paths, directions):
+    """
+    This function uses matrix coordinate encoding of the grid.
+    Compiles the paths of all the agents at once into an (agents x T) array of actions, T being the length
+    of the longest path minus one. Only integer arithmetic is used: the heading after each step is given by
+    the offset between two consecutive cells, and the action by the turn between two consecutive headings.
+    Entries after the end of a path are filled with 0 (do nothing).
+
+    Unlike actions_for_path, a 180 turn at a dead-end flips the direction of the agent anywhere in the path,
+    not only on the first step.
+
+    Returns the actions array and the number of actions of each agent.
+    """
+    number_agents = len(paths)
+    lengths = np.array([max(len(path) - 1, 0) for path in paths], dtype=int)
+    horizon = int(lengths.max()) if number_agents > 0 else 0
+    actions = np.zeros((number_agents, horizon), dtype=int)
+    if horizon == 0:
+        return actions, lengths
+
+    #pad the paths by repeating their last cell, the padding is never used as actions
+    cells = np.zeros((number_agents, horizon + 1, 2), dtype=int)
+    for k, path in enumerate(paths):
+        if len(path) > 0:
+            cells[k, :len(path)] = path
+            cells[k, len(path):] = path[-1]
+
+    offsets = np.diff(cells, axis=1)
+    valid_steps = np.arange(horizon)[None, :] < lengths[:, None]
+    invalid = valid_steps & (np.abs(offsets).sum(axis=2) > 1)
+    if invalid.any():
+        agent, k = np.argwhere(invalid)[0]
+        raise ValueError(f"invalid path entry for agent {agent}, at coordinates: {k}, {k+1}")
+
+    #heading taken by each step, -1 when the agent stays in its cell
+    headings = HEADING_FROM_OFFSET[offsets[:, :, 0] + 1, offsets[:, :, 1] + 1]
+    moved = headings >= 0
+
+    #heading of the agent before each step: heading of its last move, or its initial direction
+    last_move = np.where(moved, np.arange(horizon)[None, :], -1)
+    last_move = np.maximum.accumulate(last_move, axis=1)
+    heading_after = np.where(last_move >= 0,
+                             np.take_along_axis(headings, np.maximum(last_move, 0), axis=1),
+                             np.asarray(directions, dtype=int)[:, None])
+    heading_before = np.concatenate((np.asarray(directions, dtype=int)[:, None], heading_after[:, :-1]), axis=1)
+
+    turns = (headings - heading_before) % 4
+    actions[:] = np.where(moved, ACTION_FROM_TURN[turns], 4)
+    actions[~valid_steps] = 0
+    return actions, lengths
+
 def walk_path(env, env_renderer, path, agent_handle):
     """
     This function takes RailEnv object 'env' and RenderTool object 'env_renderer', gets the actions to walk 
@@ -100,7 +159,8 @@ def walk_path(env, env_renderer, path, agent_handle):
 def walk_many_paths(env, env_renderer, paths,draw = False):
     """
     This functions that a list of paths and makes agents walk their own path simultaneously (the list is assumed to be
-    ordered i.e. paths[k] is the path of agent k.)
+    ordered i.e. paths[k] is the path of agent k, e.g. the paths of src.flows.solution.paths_from_cells.)
+    The actions of all the agents are compiled up front with compile_actions.
     
     
     For now this assumes no collisions.
@@ -108,34 +168,19 @@ def walk_many_paths(env, env_renderer, paths,draw = False):
     if draw == True:
         draw_multiple_paths(env_renderer, paths)
     
-    actions_list = [actions_for_path(path, env.agents[k].direction) for k, path in enumerate(paths)]
-    all_done = False
-
-    start_index = setup_env(env,paths,actions_list)
+    directions = [env.agents[k].direction for k in range(len(paths))]
+    actions, lengths = compile_actions(paths, directions)
 
-   
+    start_index = setup_env(env,paths,actions)
 
-    i = 0
-    while all_done == False:
-        
-        #done here means an agent has made as many steps as was specified in its actions_for_path
-        agents_done = 0
-        actions_dict = {}
-        
-        for k in range(start_index,len(paths)):
-            
-            if  i < len(actions_list[k]):
-                actions_dict[k] = actions_list[k][i]
-            else:
-                agents_done += 1
-        
-        if agents_done == len(paths):
-            all_done = True
-        env.step(actions_dict)
+    #an agent is done once it has made as many steps as there are actions in its path
+    for i in range(actions.shape[1]):
+        active = np.flatnonzero(lengths > i)
+        active = active[active >= start_index]
+        env.step(dict(zip(active.tolist(), actions[active, i].tolist())))
         check_position(i+1,env,paths)
         env_renderer.render_env(show=True, show_predictions=False, show_observations=False)
         time.sleep(0.03)
-        i += 1
 
 
 def check_position(time,env,paths):
@@ -144,6 +189,50 @@ def check_position(time,env,paths):
             print(f"Error ! agent  {agent} is supposed to be at cell {path[time]} but is at {env.agents[agent].position} at time {time}")
 
 
+def replay_paths(env, paths, verbose = True):
+    """
+    Headless version of walk_many_paths: the actions of all the agents are compiled up front with
+    compile_actions, the env is stepped without rendering and the positions of the agents are compared
+    to the paths once the replay is over.
+
+    Returns an array of (agent, time) pairs for which the agent was not at the cell specified by its path.
+    """
+    number_agents = len(paths)
+    directions = [env.agents[k].direction for k in range(number_agents)]
+    actions, lengths = compile_actions(paths, directions)
+    horizon = actions.shape[1]
+
+    setup_env(env, paths, actions)
+
+    positions = np.full((number_agents, horizon + 1, 2), -1, dtype=int)
+    status = np.zeros((number_agents, horizon + 1), dtype=int)
+    for i in range(horizon):
+        active = np.flatnonzero(lengths > i)
+        env.step(dict(zip(active.tolist(), actions[active, i].tolist())))
+        for k in range(number_agents):
+            agent = env.agents[k]
+            if agent.position is not None:
+                positions[k, i + 1] = agent.position
+            status[k, i + 1] = agent.status
+
+    planned = np.full((number_agents, horizon + 1, 2), -1, dtype=int)
+    for k, path in enumerate(paths):
+        planned[k, :len(path)] = path
+
+    #same rule as check_position: only check the steps of the path, and not the removed agents
+    checked = np.arange(horizon + 1)[None, :] <= lengths[:, None]
+    checked[:, 0] = False
+    checked &= status != 3
+    divergences = np.argwhere(checked & (planned != positions).any(axis=2))
+
+    if verbose:
+        for agent, time_step in divergences:
+            print(f"Error ! agent  {agent} is supposed to be at cell {tuple(planned[agent, time_step])} "
+                  f"but is at {tuple(positions[agent, time_step])} at time {time_step}")
+        print(f"{len(divergences)} divergences from the plan over {horizon} time steps")
+    return divergences
+
+
 def setup_env(env,paths,actions_list,renderer = None):
 
 
@@ -0,0 +1,176 @@
+import os
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib import animation
+
+from src.graph.NetworkGraph import COLORS
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.gif')
+
+
+def cell_positions(cells):
+    """
+    Graphic coordinates of the centers of an array (..., 2) of cells (row, column), in the coordinates of
+    NetworkGraph.get_layout
+    """
+    cells = np.asarray(cells)
+    return np.stack([cells[..., 1], -cells[..., 0]], axis=-1).astype(float)
+
+
+def schedule_array(paths):
+    """
+    Stacks the paths of the agents (dict agent -> list of cells, as Solver.solution_cell, or list of lists)
+    into an (agents x T x 2) array, the paths which end before T are padded with their last cell.
+    Returns the array and the length of each path.
+    """
+    if isinstance(paths, dict):
+        paths = [paths[key] for key in sorted(paths.keys())]
+    lengths = np.array([len(path) for path in paths], dtype=int)
+    horizon = int(lengths.max()) if len(paths) > 0 else 0
+    cells = np.zeros((len(paths), horizon, 2), dtype=int)
+    for k, path in enumerate(paths):
+        if len(path) > 0:
+            cells[k, :len(path)] = path
+            cells[k, len(path):] = path[-1]
+    return cells, lengths
+
+
+class ScheduleRenderer():
+    def __init__(self, graph, jitter = 0.1, figsize = (10, 10), dpi = 100):
+        """
+        Headless renderer of a NetworkGraph and of schedules on it, drawn on a matplotlib Figure with the
+        Agg canvas (pyplot is not used, nothing is shown and nothing blocks).
+
+        The positions of the nodes and the edges are the layout arrays of the graph (see
+        NetworkGraph.compute_layout), the graph is drawn once as a LineCollection and a scatter. For a
+        schedule only the offsets of the scatter of the agents change from one frame to the next.
+        """
+        self.graph = graph
+        self.dpi = dpi
+        self.positions = graph.get_layout(jitter)
+        self.segments = self.positions[graph.layout_edges]
+
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot(111)
+        self.ax.set_aspect('equal')
+        self.ax.axis('off')
+        self.ax.add_collection(LineCollection(self.segments, colors='lightgray', linewidths=1))
+        self.ax.scatter(self.positions[:, 0], self.positions[:, 1], s=2, c='gray')
+        self.ax.autoscale_view()
+
+        #artists of the last drawn schedule
+        self.artists = []
+        self.agents = None
+
+
+    def edge_segments(self, edges):
+        """
+        (n, 2, 2) segments of a list of edges (pairs of node ids of the graph)
+        """
+        return self.positions[self.graph.get_rows(edges)]
+
+
+    def clear(self):
+        for artist in self.artists:
+            artist.remove()
+        self.artists = []
+        self.agents = None
+
+
+    def draw_edge_paths(self, paths, linewidth = 4):
+        """
+        Draws paths given as lists of edges of the graph (as Solver.solution_edge), one LineCollection
+        for all of them
+        """
+        if isinstance(paths, dict):
+            paths = [paths[key] for key in sorted(paths.keys())]
+        segments = [self.edge_segments(path) for path in paths]
+        colors = np.repeat(np.arange(len(paths)), [len(x) for x in segments])
+        collection = LineCollection(np.concatenate(segments) if segments else np.zeros((0, 2, 2)),
+                                    colors=[COLORS[i % len(COLORS)] for i in colors], linewidths=linewidth)
+        self.ax.add_collection(collection)
+        self.artists.append(collection)
+
+
+    def draw_schedule(self, paths):
+        """
+        Draws the paths of cells of the agents (see schedule_array) as one LineCollection and prepares the
+        scatter of the agents. Returns the (agents x T x 2) positions of the agents at each time step.
+        """
+        cells, lengths = schedule_array(paths)
+        positions = cell_positions(cells)
+        colors = [COLORS[i % len(COLORS)] for i in range(len(cells))]
+        collection = LineCollection(positions, colors=colors, linewidths=3, alpha=0.4)
+        self.ax.add_collection(collection)
+        self.agents = self.ax.scatter(positions[:, 0, 0], positions[:, 0, 1], s=150, c=colors, zorder=3)
+        self.artists += [collection, self.agents]
+        return positions
+
+
+    def set_time(self, positions, t):
+        self.agents.set_offsets(positions[:, t])
+        self.ax.set_title(f"t = {t}")
+
+
+    def save(self, filename):
+        self.figure.savefig(filename, dpi=self.dpi)
+
+
+    def save_network(self, filename, paths = None):
+        """
+        Writes an image of the graph, with the paths of edges of paths if not None
+        """
+        self.clear()
+        if paths is not None:
+            self.draw_edge_paths(paths)
+        self.save(filename)
+
+
+    def save_frames(self, paths, directory, prefix = "frame"):
+        """
+        Writes one PNG image per time step of the schedule paths (see schedule_array) in directory.
+        Returns the list of the files written.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.clear()
+        positions = self.draw_schedule(paths)
+        filenames = []
+        for t in range(positions.shape[1]):
+            self.set_time(positions, t)
+            filenames.append(os.path.join(directory, f"{prefix}_{t:04d}.png"))
+            self.save(filenames[-1])
+        return filenames
+
+
+    def save_video(self, paths, filename, fps = 4):
+        """
+        Writes the schedule paths as a video, a gif is written with Pillow, the other formats with ffmpeg
+        """
+        if filename.endswith('.gif'):
+            writer = animation.PillowWriter(fps=fps)
+        elif animation.writers.is_available('ffmpeg'):
+            writer = animation.FFMpegWriter(fps=fps)
+        else:
+            raise RuntimeError(f"ffmpeg is needed to write {filename}, use a .gif or save_frames")
+        self.clear()
+        positions = self.draw_schedule(paths)
+        with writer.saving(self.figure, filename, self.dpi):
+            for t in range(positions.shape[1]):
+                self.set_time(positions, t)
+                writer.grab_frame()
+        return filename
+
+
+def render_schedule(graph, paths, output, fps = 4, **kwargs):
+    """
+    Writes the schedule paths (dict agent -> list of cells, e.g. Solver.solution_cell) on the NetworkGraph
+    graph to output in one call: a video if output ends with a video extension, PNG frames in the
+    directory output otherwise. The keyword arguments are passed to ScheduleRenderer.
+    """
+    renderer = ScheduleRenderer(graph, **kwargs)
+    if output.endswith(VIDEO_EXTENSIONS):
+        return renderer.save_video(paths, output, fps)
+    return renderer.save_frames(paths, output)